@@ -93,8 +93,11 @@ async def initialize_app():
 
 async def get_cli_sessions():
     """Get all CLI sessions"""
-    all_sessions = await _session_manager.repository.get_all_sessions()
-    return [s for s in all_sessions if s["session_id"].startswith("cli-")]
+    await _session_manager.flush_all()
+    return [
+        s async for s in _session_manager.repository.iter_sessions()
+        if s["session_id"].startswith("cli-")
+    ]
 
 
 async def display_sessions():
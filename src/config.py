@@ -10,6 +10,10 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
+# Parser response cache (identical requests skip the OpenAI call)
+PARSER_CACHE_SIZE = int(os.getenv("PARSER_CACHE_SIZE", "256"))
+PARSER_CACHE_TTL_SECONDS = int(os.getenv("PARSER_CACHE_TTL_SECONDS", "3600"))
+
 # Notion Configuration
 NOTION_API_KEY = os.getenv("NOTION_API_KEY")
 NOTION_CALENDAR_DATABASE_ID = os.getenv("NOTION_CALENDAR_DATABASE_ID")  # Calendar database
@@ -1,20 +1,39 @@
-import json
+import asyncio
+import hashlib
 import sys
+import time
+from collections import OrderedDict
 from pathlib import Path
+from typing import List, Optional
 
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+import orjson
 from openai import AsyncOpenAI
-from parser.schemas import ParsedRequest
-from config import OPENAI_API_KEY, OPENAI_MODEL, PARSER_PROMPT_PATH
+from parser.schemas import AgentAction, ParsedRequest
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_MODEL,
+    PARSER_PROMPT_PATH,
+    PARSER_CACHE_SIZE,
+    PARSER_CACHE_TTL_SECONDS,
+)
 
 
 class RequestParser:
-    def __init__(self):
+    def __init__(
+        self,
+        cache_size: int = PARSER_CACHE_SIZE,
+        cache_ttl_seconds: float = PARSER_CACHE_TTL_SECONDS
+    ):
         self.client = AsyncOpenAI(api_key=OPENAI_API_KEY)
         self.model = OPENAI_MODEL
         self.prompt_template = self._load_prompt_template()
+        self.cache_size = cache_size
+        self.cache_ttl_seconds = cache_ttl_seconds
+        # sha256(text) -> (stored_at, ParsedRequest), kept in LRU order
+        self._cache: OrderedDict[str, tuple[float, ParsedRequest]] = OrderedDict()
     
     def _load_prompt_template(self) -> str:
         """Load prompt template from file"""
@@ -27,6 +46,39 @@ class RequestParser:
 Return exactly one JSON object: {{"intent":"", "agent":"", "params":{{}}}}
 Valid intents: list_files, read_file, write_note, list_notes, calendar_list, calendar_add, web_search, unknown"""
     
+    @staticmethod
+    def _cache_key(text: str) -> str:
+        """Build cache key for request text"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    def _get_cached(self, key: str) -> Optional[ParsedRequest]:
+        """Return a copy of a cached parse result, or None on miss/expiry"""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        
+        stored_at, parsed_request = entry
+        if time.monotonic() - stored_at > self.cache_ttl_seconds:
+            del self._cache[key]
+            return None
+        
+        self._cache.move_to_end(key)
+        return parsed_request.model_copy(deep=True)
+    
+    def _store_cached(self, key: str, parsed_request: ParsedRequest):
+        """Store a parse result, evicting the least recently used entry"""
+        if self.cache_size <= 0:
+            return
+        
+        self._cache[key] = (time.monotonic(), parsed_request.model_copy(deep=True))
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    def clear_cache(self):
+        """Drop all cached parse results"""
+        self._cache.clear()
+    
     async def parse_request(self, text: str) -> ParsedRequest:
         """
         Parse natural language text into structured ParsedRequest with multiple actions
@@ -37,76 +89,223 @@ Valid intents: list_files, read_file, write_note, list_notes, calendar_list, cal
         Returns:
             ParsedRequest object with list of actions
         """
+        cache_key = self._cache_key(text)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             # Format prompt with user input
             prompt = self.prompt_template.format(input_text=text)
             
-            # Call OpenAI API
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that extracts structured data from text."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=1000
-            )
-            
-            # Extract response content
-            content = response.choices[0].message.content.strip()
-            
-            # Parse JSON
-            parsed_data = json.loads(content)
-            
-            # Validate and create ParsedRequest
-            parsed_request = ParsedRequest(
-                actions=parsed_data.get("actions", []),
-                raw_text=text
-            )
-            
-            # If no actions, add fallback
-            if not parsed_request.actions:
-                from parser.schemas import AgentAction
-                parsed_request.actions = [
-                    AgentAction(
-                        intent="unknown",
-                        agent="FallbackAgent",
-                        params={"text": text}
-                    )
-                ]
+            # Call OpenAI API and parse JSON
+            content = await self._complete(prompt, max_tokens=1000)
+            parsed_data = orjson.loads(content)
             
-            return parsed_request
+            return self._build_parsed_request(parsed_data, text, cache_key)
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             # JSON parsing failed - return fallback
-            from parser.schemas import AgentAction
-            return ParsedRequest(
-                actions=[
-                    AgentAction(
-                        intent="unknown",
-                        agent="FallbackAgent",
-                        params={"text": text}
-                    )
-                ],
-                raw_text=text
-            )
+            return self._fallback_request(text)
         except Exception as e:
             # Any other error - return fallback
-            from parser.schemas import AgentAction
-            return ParsedRequest(
-                actions=[
-                    AgentAction(
-                        intent="unknown",
-                        agent="FallbackAgent",
-                        params={"text": text, "error": str(e)}
-                    )
-                ],
-                raw_text=text
-            )
+            return self._fallback_request(text, error=str(e))
+    
+    async def _complete(self, prompt: str, max_tokens: int) -> str:
+        """Send prompt to OpenAI and return the stripped response content"""
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant that extracts structured data from text."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content.strip()
+    
+    def _build_parsed_request(self, parsed_data: dict, text: str, cache_key: str) -> ParsedRequest:
+        """Validate decoded model output into a ParsedRequest"""
+        parsed_request = ParsedRequest(
+            actions=parsed_data.get("actions", []),
+            raw_text=text
+        )
+        
+        # Only successful parses are cached; fallbacks are retried next time
+        if parsed_request.actions:
+            self._store_cached(cache_key, parsed_request)
+        
+        # If no actions, add fallback
+        if not parsed_request.actions:
+            parsed_request.actions = self._fallback_request(text).actions
+        
+        return parsed_request
+    
+    @staticmethod
+    def _fallback_request(text: str, error: Optional[str] = None) -> ParsedRequest:
+        """Build a ParsedRequest routing the text to FallbackAgent"""
+        params = {"text": text}
+        if error is not None:
+            params["error"] = error
+        
+        return ParsedRequest(
+            actions=[
+                AgentAction.model_construct(
+                    intent="unknown",
+                    agent="FallbackAgent",
+                    params=params
+                )
+            ],
+            raw_text=text
+        )
+
+
+class BatchingParser:
+    """
+    Coalesces concurrent parse requests into a single OpenAI call
+    
+    Requests arriving within max_wait_ms of each other (up to max_batch_size)
+    are sent as one prompt asking for one parse per request. Single requests,
+    cache hits and malformed batch responses go through RequestParser as usual.
+    """
+    
+    def __init__(
+        self,
+        parser: Optional[RequestParser] = None,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10
+    ):
+        self.parser = parser or RequestParser()
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._dispatch_tasks: set = set()
+    
+    async def parse_request(self, text: str) -> ParsedRequest:
+        """Parse text, sharing the OpenAI round-trip with concurrent callers"""
+        cached = self.parser._get_cached(self.parser._cache_key(text))
+        if cached is not None:
+            return cached
+        
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+    
+    async def close(self):
+        """Stop the background batching task, failing requests not yet dispatched"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._fail_pending([self._queue.get_nowait()])
+        
+        if self._dispatch_tasks:
+            await asyncio.gather(*self._dispatch_tasks, return_exceptions=True)
+    
+    async def _run(self):
+        """Collect queued requests into batches and dispatch them"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait_seconds
+                
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                
+                # Dispatch without blocking collection of the next batch
+                task = asyncio.create_task(self._dispatch(batch))
+                self._dispatch_tasks.add(task)
+                task.add_done_callback(self._dispatch_tasks.discard)
+                batch = []
+        finally:
+            # A batch still being collected will never be dispatched
+            self._fail_pending(batch)
+    
+    @staticmethod
+    def _fail_pending(batch: List[tuple]):
+        """Fail the futures of requests that will not be parsed"""
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(RuntimeError("BatchingParser closed before the request was parsed"))
+    
+    async def _dispatch(self, batch: List[tuple]):
+        """Parse one batch and resolve each caller's future"""
+        texts = [text for text, _ in batch]
+        
+        try:
+            if len(batch) == 1:
+                results = [await self.parser.parse_request(texts[0])]
+            else:
+                results = await self._parse_batch(texts)
+        except Exception as e:
+            results = [self.parser._fallback_request(text, error=str(e)) for text in texts]
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def _parse_batch(self, texts: List[str]) -> List[ParsedRequest]:
+        """Parse several texts with one OpenAI call"""
+        prompt = self.parser.prompt_template.format(input_text="(see numbered requests below)")
+        prompt += (
+            f"\n\nParse each of the following {len(texts)} requests independently.\n"
+            'Return exactly one JSON object: {"results": [<object for request 1>, <object for request 2>, ...]} '
+            "with one entry per request, in order, each entry in the format described above.\n"
+        )
+        prompt += "\n".join(f"{idx}. {orjson.dumps(text).decode()}" for idx, text in enumerate(texts, 1))
+        
+        content = await self.parser._complete(prompt, max_tokens=1000 * len(texts))
+        try:
+            payload = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            payload = None
+        entries = payload.get("results") if isinstance(payload, dict) else None
+        
+        if not isinstance(entries, list) or len(entries) != len(texts):
+            # Malformed batch answer - parse individually instead
+            return list(await asyncio.gather(*(self.parser.parse_request(text) for text in texts)))
+        
+        results = []
+        for text, entry in zip(texts, entries):
+            try:
+                results.append(self.parser._build_parsed_request(entry, text, self.parser._cache_key(text)))
+            except Exception as e:
+                results.append(self.parser._fallback_request(text, error=str(e)))
+        return results
+
+
+# Global parser instance (shared so the response cache survives across calls)
+_parser: Optional[RequestParser] = None
+
+
+def get_parser() -> RequestParser:
+    """Get global parser instance"""
+    global _parser
+    if _parser is None:
+        _parser = RequestParser()
+    return _parser
 
 
 # Convenience function for direct usage
 async def parse_request(text: str) -> ParsedRequest:
     """Parse user request text into structured format"""
-    parser = RequestParser()
-    return await parser.parse_request(text)
+    return await get_parser().parse_request(text)
@@ -2,7 +2,9 @@
 Agent Router - Routes parsed requests to appropriate agents
 """
 import sys
+from collections import OrderedDict
 from pathlib import Path
+from types import MappingProxyType
 from typing import Optional
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -10,23 +12,34 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from parser.schemas import AgentAction
 
 
-# Intent to Agent mapping
-INTENT_MAP = {
+# Agent used when nothing else matches
+DEFAULT_AGENT = "FallbackAgent"
+
+# Upper bound on cached (agent, intent) resolutions; agent names come from
+# the LLM, so the set of keys is open-ended
+RESOLUTION_CACHE_SIZE = 64
+
+# Intent to Agent mapping (read-only)
+INTENT_MAP = MappingProxyType({
     "write_note": "NoteAgent",
     "list_notes": "NoteAgent",
     "calendar_list": "CalendarAgent",
     "calendar_add": "CalendarAgent",
     "web_search": "WebAgent",
-    "unknown": "FallbackAgent",
-}
+    "unknown": DEFAULT_AGENT,
+})
 
 
 class AgentRouter:
     """Routes requests to appropriate agents"""
     
-    def __init__(self):
+    def __init__(self, cache_size: int = RESOLUTION_CACHE_SIZE):
         self.intent_map = INTENT_MAP
         self._agent_registry = {}
+        self.cache_size = cache_size
+        # (agent, intent) -> resolved agent name, kept in LRU order;
+        # invalidated on registration
+        self._resolution_cache: OrderedDict[tuple, str] = OrderedDict()
     
     def register_agent(self, agent_name: str, agent_class):
         """
@@ -37,6 +50,7 @@ class AgentRouter:
             agent_class: Agent class to register
         """
         self._agent_registry[agent_name] = agent_class
+        self._resolution_cache.clear()
     
     def get_agent_name(self, action: AgentAction) -> str:
         """
@@ -48,13 +62,25 @@ class AgentRouter:
         Returns:
             Agent name string
         """
-        # First try to use the agent field from action
-        if action.agent and action.agent in self._agent_registry:
-            return action.agent
+        agent, intent = action.agent, action.intent
+        cache = self._resolution_cache
+        key = (agent, intent)
+        agent_name = cache.get(key)
+        if agent_name is not None:
+            cache.move_to_end(key)
+            return agent_name
         
-        # Fall back to intent mapping
-        agent_name = self.intent_map.get(action.intent, "FallbackAgent")
+        # First try to use the agent field from action
+        if agent and agent in self._agent_registry:
+            agent_name = agent
+        else:
+            # Fall back to intent mapping
+            agent_name = self.intent_map.get(intent, DEFAULT_AGENT)
         
+        if self.cache_size > 0:
+            cache[key] = agent_name
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
         return agent_name
     
     def route_to_agent(self, action: AgentAction):
@@ -74,7 +100,7 @@ class AgentRouter:
         
         if agent_class is None:
             # Try to get FallbackAgent as last resort
-            agent_class = self._agent_registry.get("FallbackAgent")
+            agent_class = self._agent_registry.get(DEFAULT_AGENT)
         
         if agent_class is None:
             return None
@@ -39,10 +39,19 @@ _agent_instances = {}
 _session_manager = None
 
 
-def initialize_app():
-    """Initialize MCP client, LLM client, and register agents/tools"""
+def initialize_app(force: bool = False):
+    """Initialize MCP client, LLM client, and register agents/tools
+    
+    Args:
+        force: Re-initialize even if the app was already initialized
+    """
     global _mcp_client, _llm_client, _agent_instances, _session_manager
     
+    # Already warm (e.g. initialized by tests before lifespan startup)
+    if _agent_instances and not force:
+        logger.debug("API Server already initialized, skipping")
+        return
+    
     logger.info("Initializing AI Personal Assistant API Server...")
     
     # Initialize session manager
@@ -90,6 +99,7 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown
     _session_manager.stop_cleanup_task()
+    await _session_manager.flush_all()
     logger.info("Shutting down API Server...")
 
 
@@ -2,7 +2,7 @@
 Session Repository - Abstract interface for session storage
 """
 from abc import ABC, abstractmethod
-from typing import Optional, List, Dict
+from typing import Any, AsyncIterator, Mapping, Optional, List, Dict, Tuple
 from datetime import datetime
 
 
@@ -25,6 +25,15 @@ class SessionRepository(ABC):
         """Get session metadata"""
         pass
     
+    async def get_sessions(self, session_ids: List[str]) -> List[Dict]:
+        """Get metadata of several sessions; unknown ids are skipped"""
+        sessions = []
+        for session_id in session_ids:
+            session = await self.get_session(session_id)
+            if session:
+                sessions.append(session)
+        return sessions
+    
     @abstractmethod
     async def delete_session(self, session_id: str) -> bool:
         """Delete session and all its messages"""
@@ -35,6 +44,11 @@ class SessionRepository(ABC):
         """Get all sessions"""
         pass
     
+    async def iter_sessions(self, batch_size: int = 256) -> AsyncIterator[Dict]:
+        """Yield all sessions, most recently accessed first"""
+        for session in await self.get_all_sessions():
+            yield session
+    
     @abstractmethod
     async def save_message(
         self,
@@ -47,13 +61,29 @@ class SessionRepository(ABC):
         """Save a message to session"""
         pass
     
+    async def add_messages(
+        self,
+        session_id: str,
+        rows: List[Tuple[str, str, datetime, Optional[Dict]]]
+    ) -> bool:
+        """Save several messages to session at once
+        
+        Args:
+            session_id: Session ID
+            rows: (role, content, timestamp, metadata) tuples in insertion order
+        """
+        for role, content, timestamp, metadata in rows:
+            if not await self.save_message(session_id, role, content, timestamp, metadata):
+                return False
+        return True
+    
     @abstractmethod
     async def get_messages(
         self, 
         session_id: str, 
         page: int = 0,
         page_size: int = 10
-    ) -> List[Dict]:
+    ) -> List[Mapping[str, Any]]:
         """Get messages for a session with pagination
         
         Args:
@@ -63,11 +93,78 @@ class SessionRepository(ABC):
         """
         pass
     
+    async def get_messages_page(
+        self,
+        session_id: str,
+        cursor: Optional[int] = None,
+        limit: int = 10
+    ) -> Tuple[List[Mapping[str, Any]], Optional[int]]:
+        """Get messages older than cursor using keyset pagination
+        
+        Args:
+            session_id: Session ID
+            cursor: Cursor returned by the previous call (None = most recent)
+            limit: Maximum number of messages to return
+            
+        Returns:
+            (messages oldest first, cursor for the next older page or None)
+        """
+        if limit <= 0:
+            return [], None
+        
+        # Messages carry no id here, so the cursor counts the newer messages
+        # already returned and pages are read by offset
+        skipped = cursor or 0
+        if skipped % limit == 0:
+            messages = await self.get_messages(session_id, page=skipped // limit, page_size=limit)
+        else:
+            newest = await self.get_messages(session_id, page=0, page_size=skipped + limit)
+            messages = newest[:len(newest) - skipped] if len(newest) > skipped else []
+        
+        # A short page means there is nothing older left
+        next_cursor = skipped + limit if len(messages) == limit else None
+        return messages, next_cursor
+    
+    async def get_context(self, session_id: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """Get (role, content) of the most recent messages, oldest first"""
+        messages = await self.get_messages(session_id, page=0, page_size=limit)
+        return [(msg["role"], msg["content"]) for msg in messages]
+    
+    async def iter_messages(self, session_id: str, limit: int = 10) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (role, content) of the most recent messages, oldest first"""
+        for row in await self.get_context(session_id, limit=limit):
+            yield row
+    
+    async def iter_all_messages(
+        self,
+        session_id: str,
+        page_size: int = 500
+    ) -> AsyncIterator[List[Mapping[str, Any]]]:
+        """Yield the whole history of a session as pages (order not guaranteed)"""
+        if page_size < 1:
+            raise ValueError(f"page_size must be at least 1, got {page_size}")
+        
+        cursor = None
+        while True:
+            page, cursor = await self.get_messages_page(session_id, cursor=cursor, limit=page_size)
+            if page:
+                yield page
+            if cursor is None:
+                return
+    
     @abstractmethod
-    async def delete_messages(self, session_id: str) -> bool:
-        """Delete all messages for a session"""
+    async def delete_messages(self, session_id: str) -> int:
+        """Delete all messages for a session and return how many were deleted"""
         pass
     
+    async def get_expired_session_ids(self, expiry_time: datetime) -> List[str]:
+        """Get ids of sessions that expired before expiry_time"""
+        return [
+            session["session_id"]
+            for session in await self.get_all_sessions()
+            if session["expires_at"] < expiry_time
+        ]
+    
     @abstractmethod
     async def cleanup_expired_sessions(self, expiry_time: datetime) -> int:
         """Delete sessions older than expiry_time"""
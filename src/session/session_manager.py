@@ -1,9 +1,11 @@
 """
 Session Manager - Manages conversation history per session
 """
-from typing import Dict, List, Optional
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, List, Mapping, Optional, Tuple
 from datetime import datetime, timedelta
 import asyncio
+import time
 from session.repository import SessionRepository
 from session.sqlite_repository import SQLiteSessionRepository
 from utils.logger import get_logger
@@ -14,65 +16,244 @@ logger = get_logger()
 class ConversationHistory:
     """Stores conversation history for a single session"""
     
-    def __init__(self, session_id: str, repository: SessionRepository):
+    # Messages added within this window are written in one transaction
+    FLUSH_DELAY_SECONDS = 0.005
+    # Repeated accesses within this window update the session row only once
+    ACCESS_WRITE_INTERVAL_SECONDS = 1.0
+    
+    def __init__(
+        self,
+        session_id: str,
+        repository: SessionRepository,
+        context_cache_ttl_seconds: Optional[float] = None,
+        created_at: Optional[datetime] = None
+    ):
         self.session_id = session_id
         self.repository = repository
-        self.created_at = datetime.now()
-        self.last_accessed = datetime.now()
-        self._messages_cache: Optional[List[Dict]] = None
+        # None disables the LLM context cache
+        self.context_cache_ttl_seconds = context_cache_ttl_seconds
+        # One clock read serves both fields (callers usually have one already)
+        now = created_at or datetime.now()
+        self.created_at = now
+        self.last_accessed = now
+        # (role, content, timestamp, metadata) rows not yet written to the repository
+        self._pending: List[Tuple[str, str, datetime, Optional[Dict]]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        # Serializes flushes so a read never overtakes an in-flight write
+        self._flush_lock = asyncio.Lock()
+        # Most recent stored (role, content) pairs, extended by each successful flush
+        self._context_cache: Optional[Deque[Tuple[str, str]]] = None
+        self._context_cached_at = 0.0
+        # Monotonic time of the last session row write (None = never written)
+        self._access_written_at: Optional[float] = None
     
     async def add_message(self, role: str, content: str, metadata: Optional[Dict] = None):
-        """Add a message to conversation history"""
+        """Add a message to conversation history
+        
+        The write is buffered and flushed shortly after, together with any
+        other messages added in the meantime. Reads flush pending messages
+        first, so they are always visible to this session.
+        """
         timestamp = datetime.now()
-        expires_at = timestamp + timedelta(days=7)  # 7일 후 만료
+        self._pending.append((role, content, timestamp, metadata))
+        
+        # Update session access time
+        self.last_accessed = timestamp
+        
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+        
+        logger.debug(f"Session {self.session_id}: Added {role} message")
+    
+    async def add_messages(self, messages: Iterable[Tuple[str, str, Optional[Dict]]]):
+        """Add several messages and write them in one transaction
+        
+        Args:
+            messages: (role, content, metadata) tuples in conversation order
+        """
+        for role, content, metadata in messages:
+            timestamp = datetime.now()
+            self._pending.append((role, content, timestamp, metadata))
+            self.last_accessed = timestamp
+        
+        await self.flush()
+    
+    async def _flush_soon(self):
+        """Flush pending messages after the debounce delay"""
+        await asyncio.sleep(self.FLUSH_DELAY_SECONDS)
+        await self.flush()
+    
+    async def flush(self) -> bool:
+        """Write pending messages to the repository in one batch
+        
+        Waits for a flush already in progress, so once this returns every
+        message added before the call is stored. Rows stay pending until
+        the write succeeds and are retried by the next flush otherwise.
+        
+        Returns:
+            True if nothing is left pending
+        """
+        async with self._flush_lock:
+            pending = self._pending
+            if not pending:
+                return True
+            
+            rows = list(pending)
+            timestamp = rows[-1][2]
+            expires_at = timestamp + timedelta(days=7)  # 7일 후 만료
+            
+            # Ensure session exists in repository first and update expiry
+            await self.repository.save_session(
+                session_id=self.session_id,
+                created_at=self.created_at,
+                last_accessed=timestamp,
+                expires_at=expires_at
+            )
+            self._access_written_at = time.monotonic()
+            
+            if not await self.repository.add_messages(self.session_id, rows):
+                logger.warning(f"Session {self.session_id}: {len(rows)} messages left pending after a failed write")
+                return False
+            
+            # Rows added while writing stay queued for the next flush
+            del pending[:len(rows)]
+            if self._context_cache is not None:
+                self._context_cache.extend((role, content) for role, content, _, _ in rows)
+            return not self._pending
+    
+    @property
+    def has_pending_writes(self) -> bool:
+        """Whether messages are waiting to be written to the repository"""
+        return bool(self._pending)
+    
+    async def touch(self, accessed_at: datetime, expires_at: datetime, force: bool = False):
+        """Record an access, writing it to the repository at most once per interval
+        
+        Args:
+            accessed_at: Access time
+            expires_at: Expiry to store along with the access time
+            force: Write even if the session row was updated recently
+        """
+        self.last_accessed = accessed_at
+        
+        now = time.monotonic()
+        if (
+            not force
+            and self._access_written_at is not None
+            and now - self._access_written_at < self.ACCESS_WRITE_INTERVAL_SECONDS
+        ):
+            return
         
-        # Ensure session exists in repository first and update expiry
         await self.repository.save_session(
             session_id=self.session_id,
             created_at=self.created_at,
-            last_accessed=timestamp,
+            last_accessed=accessed_at,
             expires_at=expires_at
         )
+        self._access_written_at = now
+    
+    async def discard_pending(self):
+        """Drop unwritten messages (used when the session is deleted)
         
-        # Save message to repository
-        await self.repository.save_message(
-            session_id=self.session_id,
-            role=role,
-            content=content,
-            timestamp=timestamp,
-            metadata=metadata
-        )
-        
-        # Update session access time
-        self.last_accessed = timestamp
-        
-        # Invalidate cache
-        self._messages_cache = None
-        
-        logger.debug(f"Session {self.session_id}: Added {role} message")
+        Waits for a flush already writing, so none of its rows are stored
+        after this returns.
+        """
+        async with self._flush_lock:
+            self._drop_pending()
     
-    async def get_messages(self, page: int = 0, page_size: int = 10) -> List[Dict]:
+    def _drop_pending(self):
+        """Forget unwritten messages and the scheduled flush (flush lock held)"""
+        self._pending = []
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+    
+    async def get_messages(self, page: int = 0, page_size: int = 10) -> List[Mapping[str, Any]]:
         """Get conversation messages with pagination
         
         Args:
             page: Page number (0-based, 0 = most recent)
             page_size: Number of messages per page
         """
+        await self.flush()
         messages = await self.repository.get_messages(self.session_id, page=page, page_size=page_size)
         return messages
     
+    async def get_messages_page(
+        self,
+        cursor: Optional[int] = None,
+        limit: int = 10
+    ) -> Tuple[List[Mapping[str, Any]], Optional[int]]:
+        """Get conversation messages older than cursor
+        
+        Preferred over page-based access for deep history: each page is an
+        index range scan regardless of how far back it is.
+        
+        Args:
+            cursor: Cursor returned by the previous call (None = most recent)
+            limit: Number of messages per page
+            
+        Returns:
+            (messages oldest first, cursor for the next older page or None)
+        """
+        await self.flush()
+        return await self.repository.get_messages_page(self.session_id, cursor=cursor, limit=limit)
+    
     async def get_context_for_llm(self, limit: int = 10) -> List[Dict]:
-        """Get recent messages formatted for LLM context"""
-        messages = await self.get_messages(page=0, page_size=limit)
-        return [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in messages
-        ]
+        """Get recent messages formatted for LLM context
+        
+        With a context cache TTL set, the recent messages are read once and
+        then maintained in memory, so repeated calls skip the repository.
+        """
+        await self.flush()
+        rows = self._get_cached_context(limit)
+        if rows is None:
+            # Holding the flush lock keeps a concurrent flush from extending
+            # the cache before it is replaced with this read
+            async with self._flush_lock:
+                rows = await self.repository.get_context(self.session_id, limit=limit)
+                if self.context_cache_ttl_seconds is not None:
+                    self._context_cache = deque(rows, maxlen=limit)
+                    self._context_cached_at = time.monotonic()
+        
+        return [{"role": role, "content": content} for role, content in rows]
+    
+    async def iter_context_for_llm(self, limit: int = 10) -> AsyncIterator[Dict]:
+        """Yield recent messages formatted for LLM context, oldest first"""
+        await self.flush()
+        rows = self._get_cached_context(limit)
+        if rows is not None:
+            for role, content in rows:
+                yield {"role": role, "content": content}
+            return
+        
+        async for role, content in self.repository.iter_messages(self.session_id, limit=limit):
+            yield {"role": role, "content": content}
+    
+    def _get_cached_context(self, limit: int) -> Optional[List[Tuple[str, str]]]:
+        """Return the last limit cached (role, content) pairs, or None on miss"""
+        cache = self._context_cache
+        if cache is None:
+            return None
+        
+        if time.monotonic() - self._context_cached_at > self.context_cache_ttl_seconds:
+            self._context_cache = None
+            return None
+        
+        # A cache that is not full holds the whole history, so any limit fits
+        if limit > cache.maxlen and len(cache) == cache.maxlen:
+            return None
+        
+        return list(cache)[-limit:] if limit > 0 else []
     
     async def clear(self):
         """Clear conversation history"""
-        await self.repository.delete_messages(self.session_id)
-        self._messages_cache = None
+        # An in-flight flush finishes first, so its rows cannot reappear
+        async with self._flush_lock:
+            self._drop_pending()
+            await self.repository.delete_messages(self.session_id)
+            if self._context_cache is not None:
+                self._context_cache.clear()
         logger.info(f"Session {self.session_id}: History cleared")
     
     async def get_message_count(self) -> int:
@@ -87,11 +268,23 @@ class SessionManager:
     def __init__(
         self, 
         repository: Optional[SessionRepository] = None,
-        session_expiry_days: int = 7
+        session_expiry_days: int = 7,
+        context_cache_enabled: bool = True,
+        context_cache_ttl_seconds: Optional[float] = None,
+        max_sessions: int = 1024
     ):
         self.repository = repository or SQLiteSessionRepository()
-        self.sessions: Dict[str, ConversationHistory] = {}
+        # In-memory cache in LRU order; evicted sessions stay in the repository
+        self.sessions: OrderedDict[str, ConversationHistory] = OrderedDict()
+        self.max_sessions = max_sessions
         self.session_expiry_days = session_expiry_days
+        # LLM context cache TTL handed to each session (defaults to the session expiry)
+        if not context_cache_enabled:
+            self.context_cache_ttl_seconds = None
+        elif context_cache_ttl_seconds is None:
+            self.context_cache_ttl_seconds = timedelta(days=session_expiry_days).total_seconds()
+        else:
+            self.context_cache_ttl_seconds = context_cache_ttl_seconds
         self._cleanup_task = None
         logger.info(f"SessionManager initialized (expiry: {session_expiry_days} days)")
     
@@ -103,14 +296,9 @@ class SessionManager:
         # Check in-memory cache first
         if session_id in self.sessions:
             session = self.sessions[session_id]
-            session.last_accessed = now
+            self.sessions.move_to_end(session_id)
             # 세션 사용 시마다 만료 기한 갱신 (7일 연장)
-            await self.repository.save_session(
-                session_id=session_id,
-                created_at=session.created_at,
-                last_accessed=session.last_accessed,
-                expires_at=expires_at
-            )
+            await session.touch(now, expires_at)
             return session
         
         # Check if session exists in repository
@@ -118,58 +306,101 @@ class SessionManager:
         
         if session_data:
             # Restore from repository
-            session = ConversationHistory(session_id, self.repository)
+            session = self._new_session(session_id)
             session.created_at = session_data["created_at"]
-            session.last_accessed = now
-            self.sessions[session_id] = session
+            self._cache_session(session)
             
             # 세션 복원 시에도 만료 기한 갱신
-            await self.repository.save_session(
-                session_id=session_id,
-                created_at=session.created_at,
-                last_accessed=session.last_accessed,
-                expires_at=expires_at
-            )
+            await session.touch(now, expires_at, force=True)
             
             logger.info(f"Restored session from storage: {session_id}")
         else:
             # Create new session
-            session = ConversationHistory(session_id, self.repository)
-            self.sessions[session_id] = session
+            session = self._new_session(session_id, created_at=now)
+            self._cache_session(session)
             
-            await self.repository.save_session(
-                session_id=session_id,
-                created_at=session.created_at,
-                last_accessed=session.last_accessed,
-                expires_at=expires_at
-            )
+            await session.touch(now, expires_at, force=True)
             
             logger.info(f"Created new session: {session_id}")
         
         return session
     
+    def _cache_session(self, session: ConversationHistory):
+        """Add session to the in-memory cache, evicting the least recently used"""
+        self.sessions[session.session_id] = session
+        self.sessions.move_to_end(session.session_id)
+        excess = len(self.sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        
+        # Sessions with unwritten messages stay pinned until flushed, so a
+        # reload never reads around their writes and flush_all still sees them
+        evicted = []
+        for session_id, cached in self.sessions.items():
+            if not cached.has_pending_writes:
+                evicted.append(session_id)
+                if len(evicted) == excess:
+                    break
+        for session_id in evicted:
+            del self.sessions[session_id]
+    
+    def _new_session(self, session_id: str, created_at: Optional[datetime] = None) -> ConversationHistory:
+        """Build a ConversationHistory using this manager's settings"""
+        return ConversationHistory(
+            session_id,
+            self.repository,
+            context_cache_ttl_seconds=self.context_cache_ttl_seconds,
+            created_at=created_at
+        )
+    
     async def get_session(self, session_id: str) -> Optional[ConversationHistory]:
         """Get existing session"""
         # Check in-memory cache
         if session_id in self.sessions:
+            self.sessions.move_to_end(session_id)
             return self.sessions[session_id]
         
         # Check repository
         session_data = await self.repository.get_session(session_id)
         if session_data:
-            session = ConversationHistory(session_id, self.repository)
+            session = self._new_session(session_id)
             session.created_at = session_data["created_at"]
             session.last_accessed = session_data["last_accessed"]
-            self.sessions[session_id] = session
+            self._cache_session(session)
             return session
         
         return None
     
+    async def prewarm(self, session_ids: List[str]) -> int:
+        """Load stored sessions into the cache with one repository query
+        
+        Args:
+            session_ids: Sessions expected to be used soon (e.g. at startup)
+            
+        Returns:
+            Number of sessions newly loaded
+        """
+        missing = [sid for sid in session_ids if sid not in self.sessions]
+        if not missing:
+            return 0
+        
+        loaded = 0
+        for session_data in await self.repository.get_sessions(missing):
+            session = self._new_session(session_data["session_id"])
+            session.created_at = session_data["created_at"]
+            session.last_accessed = session_data["last_accessed"]
+            self._cache_session(session)
+            loaded += 1
+        
+        logger.info(f"Prewarmed {loaded} sessions")
+        return loaded
+    
     async def delete_session(self, session_id: str) -> bool:
         """Delete a session"""
-        # Remove from memory
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        # Remove from memory, dropping writes that would re-create it
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            await session.discard_pending()
         
         # Remove from repository
         deleted = await self.repository.delete_session(session_id)
@@ -183,18 +414,17 @@ class SessionManager:
         """Remove expired sessions (expires_at < now)"""
         now = datetime.now()
         
+        # Only the expired ids are looked at, not every cached session
+        expired_ids = await self.repository.get_expired_session_ids(now)
+        
         # Cleanup from repository (sessions where expires_at < now)
         deleted_count = await self.repository.cleanup_expired_sessions(now)
         
-        # Cleanup from memory cache - remove sessions that are in deleted list
-        # We need to check repository to see which sessions still exist
+        # Cleanup from memory cache
         expired_in_memory = []
-        for sid in list(self.sessions.keys()):
-            session_data = await self.repository.get_session(sid)
-            if not session_data:
-                # Session was deleted from repository
+        for sid in expired_ids:
+            if self.sessions.pop(sid, None) is not None:
                 expired_in_memory.append(sid)
-                del self.sessions[sid]
         
         if deleted_count > 0 or expired_in_memory:
             logger.info(f"Cleaned up {deleted_count} expired sessions from storage, {len(expired_in_memory)} from cache")
@@ -205,8 +435,14 @@ class SessionManager:
     
     async def get_total_message_count(self) -> int:
         """Get total number of messages across all sessions"""
+        await self.flush_all()
         return await self.repository.get_total_message_count()
     
+    async def flush_all(self):
+        """Write pending messages of all cached sessions"""
+        for session in list(self.sessions.values()):
+            await session.flush()
+    
     async def start_cleanup_task(self, interval_minutes: int = 10):
         """Start background task to cleanup expired sessions"""
         async def cleanup_loop():
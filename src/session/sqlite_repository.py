@@ -1,44 +1,406 @@
 """
 SQLite implementation of SessionRepository
 """
+import collections.abc
 import sqlite3
-import json
 import asyncio
-from typing import Optional, List, Dict
+import contextvars
+import itertools
+import queue
+import threading
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Iterator, Mapping, Optional, List, Dict, Tuple, TypeVar
 from datetime import datetime
 from pathlib import Path
+
+import orjson
 from session.repository import SessionRepository
 from utils.logger import get_logger
 
 logger = get_logger()
 
+T = TypeVar("T")
+
+# Applied to every file database connection (WAL itself is set once on the file)
+CONNECTION_PRAGMAS = """
+PRAGMA foreign_keys = ON;
+-- Safe with WAL and avoids an fsync on every commit
+PRAGMA synchronous = NORMAL;
+-- Wait for other connections' write locks instead of failing
+PRAGMA busy_timeout = 5000;
+-- Keep temp tables/indices (e.g. sorts) off disk
+PRAGMA temp_store = MEMORY;
+-- ~64 MB page cache
+PRAGMA cache_size = -64000;
+"""
+
+# Stays below SQLite's default limit of 999 bound parameters per statement
+MAX_IN_PARAMS = 900
+
+# Stored in PRAGMA user_version; 1 = metadata stored as BLOB, 2 = role stored as INTEGER,
+# 3 = single-column session_id index dropped (idx_messages_context covers it)
+SCHEMA_VERSION = 3
+
+# Known roles are stored as small integers; any other role is kept as TEXT
+ROLE_NAMES = ("user", "assistant", "system", "tool")
+ROLE_IDS = {name: role_id for role_id, name in enumerate(ROLE_NAMES)}
+# Prefixed onto other roles so the INTEGER column cannot coerce numeric-looking
+# names such as "7" into (possibly known) role ids
+CUSTOM_ROLE_PREFIX = ":"
+
+SCHEMA_SQL = """
+BEGIN;
+
+-- Sessions table
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    last_accessed TEXT NOT NULL,
+    expires_at TEXT NOT NULL
+);
+
+-- Messages table
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    metadata BLOB,
+    FOREIGN KEY (session_id) REFERENCES sessions(session_id) ON DELETE CASCADE
+);
+
+-- Indexes for performance
+-- Covers the LLM context query (no table lookups) and keyset pagination by id
+CREATE INDEX IF NOT EXISTS idx_messages_context ON messages(session_id, id DESC, role, content);
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_accessed ON sessions(last_accessed);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+
+COMMIT;
+"""
+
+# Prepared statements kept per connection; every query uses one of the
+# constant SQL texts below so repeated calls skip re-parsing
+CACHED_STATEMENTS = 256
+
+_UPSERT_SESSION_SQL = """
+    INSERT INTO sessions (session_id, created_at, last_accessed, expires_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(session_id) DO UPDATE SET
+        last_accessed = excluded.last_accessed,
+        expires_at = excluded.expires_at
+"""
+
+_SELECT_SESSION_SQL = """
+    SELECT session_id, created_at, last_accessed, expires_at
+    FROM sessions
+    WHERE session_id = ?
+"""
+
+_INSERT_MESSAGE_SQL = """
+    INSERT INTO messages (session_id, role, content, timestamp, metadata)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+_DELETE_SESSION_SQL = "DELETE FROM sessions WHERE session_id = ?"
+
+_SELECT_ALL_SESSIONS_SQL = """
+    SELECT session_id, created_at, last_accessed, expires_at
+    FROM sessions
+    ORDER BY last_accessed DESC
+"""
+
+_SELECT_SESSIONS_BATCH_SQL = """
+    SELECT session_id, created_at, last_accessed, expires_at
+    FROM sessions
+    ORDER BY last_accessed DESC, session_id DESC
+    LIMIT ?
+"""
+
+_SELECT_SESSIONS_BATCH_AFTER_SQL = """
+    SELECT session_id, created_at, last_accessed, expires_at
+    FROM sessions
+    WHERE (last_accessed, session_id) < (?, ?)
+    ORDER BY last_accessed DESC, session_id DESC
+    LIMIT ?
+"""
+
+_SELECT_EXPIRED_SESSION_IDS_SQL = """
+    SELECT session_id FROM sessions
+    WHERE expires_at < ?
+"""
+
+_DELETE_EXPIRED_SESSIONS_SQL = """
+    DELETE FROM sessions
+    WHERE expires_at < ?
+"""
+
+_COUNT_SESSIONS_SQL = "SELECT COUNT(*) as count FROM sessions"
+
+_DELETE_MESSAGES_SQL = "DELETE FROM messages WHERE session_id = ?"
+
+_SELECT_MESSAGES_OFFSET_SQL = """
+    SELECT id, role, content, timestamp, metadata
+    FROM messages
+    WHERE session_id = ?
+    ORDER BY id DESC
+    LIMIT ? OFFSET ?
+"""
+
+_SELECT_MESSAGES_SQL = """
+    SELECT id, role, content, timestamp, metadata
+    FROM messages
+    WHERE session_id = ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+_SELECT_MESSAGES_BEFORE_SQL = """
+    SELECT id, role, content, timestamp, metadata
+    FROM messages
+    WHERE session_id = ? AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+_SELECT_CONTEXT_SQL = """
+    SELECT role, content
+    FROM messages
+    WHERE session_id = ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+_SELECT_CONTEXT_BOUNDS_SQL = """
+    SELECT MIN(id), MAX(id)
+    FROM (
+        SELECT id FROM messages
+        WHERE session_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    )
+"""
+
+_SELECT_CONTEXT_BATCH_SQL = """
+    SELECT id, role, content
+    FROM messages
+    WHERE session_id = ? AND id > ? AND id <= ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+_SELECT_ID_RANGE_SQL = """
+    SELECT MIN(id), MAX(id), COUNT(*)
+    FROM messages
+    WHERE session_id = ?
+"""
+
+_SELECT_MESSAGES_BETWEEN_SQL = """
+    SELECT id, role, content, timestamp, metadata
+    FROM messages
+    WHERE session_id = ? AND id BETWEEN ? AND ?
+    ORDER BY id
+"""
+
+_COUNT_MESSAGES_SQL = "SELECT COUNT(*) as count FROM messages"
+
+
+@lru_cache(maxsize=None)
+def _select_sessions_in_sql(size: int) -> str:
+    """SELECT for sessions whose id is among size bound parameters"""
+    placeholders = ",".join("?" * size)
+    return f"""
+        SELECT session_id, created_at, last_accessed, expires_at
+        FROM sessions
+        WHERE session_id IN ({placeholders})
+    """
+
+
+def _encode_role(role: str):
+    """Map a role name to its stored value"""
+    role_id = ROLE_IDS.get(role)
+    return role_id if role_id is not None else CUSTOM_ROLE_PREFIX + role
+
+
+def _decode_role(value) -> str:
+    """Map a stored role value back to the role name"""
+    if isinstance(value, int):
+        # Out-of-range ids are numeric roles coerced before they were prefixed
+        return ROLE_NAMES[value] if 0 <= value < len(ROLE_NAMES) else str(value)
+    if isinstance(value, str):
+        # Unprefixed text is a custom role written by an older version
+        return value[len(CUSTOM_ROLE_PREFIX):] if value.startswith(CUSTOM_ROLE_PREFIX) else value
+    return str(value)
+
+
+def _encode_metadata(metadata: Optional[Dict]) -> Optional[bytes]:
+    """Encode message metadata as compact UTF-8 JSON bytes"""
+    if not metadata:
+        return None
+    return orjson.dumps(metadata, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _decode_metadata(value) -> Dict:
+    """Decode stored metadata (BLOB, or TEXT written by older versions)"""
+    return orjson.loads(value) if value else {}
+
+
+class MessageRecord(collections.abc.Mapping):
+    """Read-only message view over a sqlite3.Row
+    
+    Behaves like the message dict (role, content, timestamp, metadata) without
+    copying the row into one; metadata is decoded on first access only.
+    """
+    
+    __slots__ = ("_row", "_metadata")
+    
+    _KEYS = ("role", "content", "timestamp", "metadata")
+    
+    def __init__(self, row: sqlite3.Row):
+        self._row = row
+        self._metadata = None
+    
+    @property
+    def metadata(self) -> Dict:
+        """Decoded metadata, cached after the first access"""
+        if self._metadata is None:
+            self._metadata = _decode_metadata(self._row["metadata"])
+        return self._metadata
+    
+    def __getitem__(self, key: str) -> Any:
+        if key == "metadata":
+            return self.metadata
+        if key == "role":
+            return _decode_role(self._row["role"])
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return self._row[key]
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._KEYS)
+    
+    def __len__(self) -> int:
+        return len(self._KEYS)
+    
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+async def _acquire_lock(lock: threading.Lock):
+    """Acquire a thread lock from async code without blocking the event loop
+    
+    The blocking acquire runs in a worker thread. If the caller is cancelled
+    while waiting, the thread still gets the lock, so it is released again
+    as soon as that happens instead of being held forever.
+    """
+    acquiring = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        def release(done: asyncio.Future):
+            if not done.cancelled() and done.exception() is None:
+                lock.release()
+        acquiring.add_done_callback(release)
+        raise
+
+
+class _Transaction:
+    """Connection and bookkeeping of an open transaction block"""
+    
+    __slots__ = ("conn", "lock", "savepoints")
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        # Serializes tasks started inside the block, which share the connection
+        self.lock = threading.Lock()
+        self.savepoints = itertools.count()
+
 
 class SQLiteSessionRepository(SessionRepository):
     """SQLite-based session storage"""
     
-    def __init__(self, db_path: str = "data/sessions.db"):
+    def __init__(
+        self,
+        db_path: str = "data/sessions.db",
+        conn: Optional[sqlite3.Connection] = None,
+        shards: int = 4,
+        read_pool_size: int = 4
+    ):
+        """
+        Initialize repository and schema
+        
+        Args:
+            db_path: Database file path, or ":memory:"
+            conn: Existing connection to use instead of opening db_path
+                (must allow use from other threads); its row_factory is
+                set to sqlite3.Row and it is never closed by the repository
+            shards: Number of pooled connections for file databases; each
+                session always uses the same one
+            read_pool_size: Number of extra read-only connections serving
+                get_* queries of file databases (0 = read on the shards)
+        """
         self.db_path = db_path
-        self._conn = None
+        self._conn = conn
+        # Serializes worker threads sharing the persistent connection
+        self._conn_lock = threading.Lock()
+        # SQLite allows one writer per database: writes and transaction blocks
+        # queue on this loop-side lock (without tying up worker threads)
+        # instead of failing with SQLITE_BUSY after busy_timeout. Reads that
+        # cannot use the read pool queue here too, since they share the
+        # connections a transaction block keeps locked across awaits
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._write_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        # Transaction block the current task is inside, if any
+        self._transaction: contextvars.ContextVar[Optional[_Transaction]] = \
+            contextvars.ContextVar(f"sqlite_transaction_{id(self)}", default=None)
+        self._open_transaction: Optional[_Transaction] = None
         self._ensure_db_directory()
         self._init_db()
+        
+        # File databases get a pool of long-lived connections, each guarded by
+        # its own lock
+        self._shards: List[Tuple[sqlite3.Connection, threading.Lock]] = []
+        if self._conn is None:
+            self._shards = [
+                (self._connect(check_same_thread=False), threading.Lock())
+                for _ in range(max(1, shards))
+            ]
+        
+        # Read-only connections for file databases; under WAL readers never
+        # block the writers or each other
+        self._read_pool: Optional[queue.SimpleQueue] = None
+        if self._conn is None and read_pool_size > 0:
+            self._read_pool = queue.SimpleQueue()
+            for _ in range(read_pool_size):
+                self._read_pool.put(self._connect(check_same_thread=False, read_only=True))
+            self._read_pool_size = read_pool_size
         logger.info(f"SQLite session repository initialized: {db_path}")
     
     def _ensure_db_directory(self):
         """Ensure database directory exists"""
-        if self.db_path != ":memory:":
+        if self._conn is None and self.db_path != ":memory:":
             db_dir = Path(self.db_path).parent
             db_dir.mkdir(parents=True, exist_ok=True)
     
     def _init_db(self):
         """Initialize database schema"""
         # For :memory: databases, keep a persistent connection
-        if self.db_path == ":memory:":
-            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        if self._conn is not None or self.db_path == ":memory:":
+            if self._conn is None:
+                self._conn = sqlite3.connect(
+                    self.db_path,
+                    check_same_thread=False,
+                    cached_statements=CACHED_STATEMENTS
+                )
             self._conn.row_factory = sqlite3.Row
             self._conn.execute("PRAGMA foreign_keys = ON")
             conn = self._conn
         else:
             conn = sqlite3.connect(self.db_path)
+            # WAL lets readers proceed while a batch of messages is written
+            conn.execute("PRAGMA journal_mode = WAL")
         
         cursor = conn.cursor()
         
@@ -73,72 +435,254 @@ class SQLiteSessionRepository(SessionRepository):
                 
                 conn.commit()
         
-        # Sessions table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                session_id TEXT PRIMARY KEY,
-                created_at TEXT NOT NULL,
-                last_accessed TEXT NOT NULL,
-                expires_at TEXT NOT NULL
-            )
-        """)
+        messages_exist = cursor.execute("""
+            SELECT name FROM sqlite_master 
+            WHERE type='table' AND name='messages'
+        """).fetchone() is not None
         
-        # Messages table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp TEXT NOT NULL,
-                metadata TEXT,
-                FOREIGN KEY (session_id) REFERENCES sessions(session_id) ON DELETE CASCADE
-            )
-        """)
+        schema_version = cursor.execute("PRAGMA user_version").fetchone()[0]
         
-        # Indexes for performance
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_messages_session_id 
-            ON messages(session_id)
-        """)
+        if messages_exist and schema_version < 1:
+            # Metadata used to be stored as escaped JSON TEXT; rewrite it once as BLOB
+            cursor.execute("""
+                UPDATE messages
+                SET metadata = CAST(metadata AS BLOB)
+                WHERE typeof(metadata) = 'text'
+            """)
+            if cursor.rowcount > 0:
+                logger.info(f"Migrated metadata of {cursor.rowcount} messages to BLOB")
+            conn.commit()
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_messages_timestamp 
-            ON messages(timestamp)
-        """)
+        if messages_exist and schema_version < 2:
+            self._migrate_role_column(conn)
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_sessions_last_accessed 
-            ON sessions(last_accessed)
-        """)
+        if messages_exist and schema_version < 3:
+            # Both are left-prefixes of idx_messages_context and only cost writes
+            conn.execute("DROP INDEX IF EXISTS idx_messages_session_id")
+            conn.execute("DROP INDEX IF EXISTS idx_messages_session_id_id")
+            conn.commit()
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_sessions_expires_at 
-            ON sessions(expires_at)
-        """)
+        # Tables and indexes in a single script / transaction
+        conn.executescript(SCHEMA_SQL)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         
-        conn.commit()
-        if self.db_path != ":memory:":
+        if conn is not self._conn:
             conn.close()
         logger.debug("Database schema initialized")
     
+    @staticmethod
+    def _migrate_role_column(conn: sqlite3.Connection):
+        """Rebuild the messages table with an INTEGER role column
+        
+        Column affinity cannot be altered in place, so the table is copied;
+        its indexes are recreated by SCHEMA_SQL afterwards.
+        """
+        logger.info("Migrating messages table: storing role as INTEGER")
+        role_case = " ".join(f"WHEN '{name}' THEN {role_id}" for name, role_id in ROLE_IDS.items())
+        conn.executescript(f"""
+            BEGIN;
+            CREATE TABLE messages_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                metadata BLOB,
+                FOREIGN KEY (session_id) REFERENCES sessions(session_id) ON DELETE CASCADE
+            );
+            INSERT INTO messages_new (id, session_id, role, content, timestamp, metadata)
+            SELECT id, session_id, CASE role {role_case} ELSE '{CUSTOM_ROLE_PREFIX}' || role END, content, timestamp, metadata
+            FROM messages;
+            DROP TABLE messages;
+            ALTER TABLE messages_new RENAME TO messages;
+            COMMIT;
+        """)
+    
+    def _connect(self, check_same_thread: bool = True, read_only: bool = False) -> sqlite3.Connection:
+        """Open a configured connection to the database file"""
+        database, uri = self.db_path, False
+        if read_only:
+            database, uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro", True
+        
+        conn = sqlite3.connect(
+            database,
+            check_same_thread=check_same_thread,
+            cached_statements=CACHED_STATEMENTS,
+            uri=uri
+        )
+        conn.row_factory = sqlite3.Row
+        conn.executescript(CONNECTION_PRAGMAS)
+        return conn
+    
     def _get_connection(self) -> sqlite3.Connection:
         """Get database connection"""
-        # For :memory: databases, reuse the persistent connection
-        if self.db_path == ":memory:" and self._conn:
+        # For :memory: or caller-provided databases, reuse the persistent connection
+        if self._conn is not None:
             return self._conn
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        # Enable foreign keys
-        conn.execute("PRAGMA foreign_keys = ON")
-        return conn
+        return self._connect()
     
     def _close_connection(self, conn: sqlite3.Connection):
-        """Close connection if not using :memory:"""
-        if self.db_path != ":memory:":
+        """Close connection unless it is the persistent one"""
+        if conn is not self._conn:
             conn.close()
     
+    def _select_shard(self, shard_key: Optional[str]) -> Tuple[sqlite3.Connection, threading.Lock]:
+        """Pick the connection and lock serving shard_key"""
+        if self._conn is not None:
+            return self._conn, self._conn_lock
+        
+        index = hash(shard_key) % len(self._shards) if shard_key is not None else 0
+        return self._shards[index]
+    
+    def _execute(self, operation: Callable[[sqlite3.Connection], T], shard_key: Optional[str] = None) -> T:
+        """Run operation on the shard connection while holding its lock"""
+        transaction = self._current_transaction()
+        if transaction is not None:
+            # The block already holds the shard lock and owns commit/rollback
+            with transaction.lock:
+                return operation(transaction.conn)
+        
+        conn, lock = self._select_shard(shard_key)
+        with lock:
+            try:
+                return operation(conn)
+            except Exception:
+                # Never leave a half-done transaction on a long-lived connection
+                conn.rollback()
+                raise
+    
+    def _execute_read(self, operation: Callable[[sqlite3.Connection], T], shard_key: Optional[str] = None) -> T:
+        """Run a read-only operation on a pooled reader connection"""
+        # Reads inside transaction() must see its uncommitted writes
+        if self._read_pool is None or self._current_transaction() is not None:
+            return self._execute(operation, shard_key)
+        
+        conn = self._read_pool.get()
+        try:
+            return operation(conn)
+        finally:
+            self._read_pool.put(conn)
+    
+    async def _run(self, operation: Callable[[sqlite3.Connection], T], shard_key: Optional[str] = None) -> T:
+        """Run a blocking database operation in a worker thread
+        
+        Args:
+            operation: Callable receiving the connection to use
+            shard_key: Session ID the operation belongs to, if any
+            
+        Returns:
+            Whatever operation returns
+        """
+        if self._current_transaction() is not None:
+            # The enclosing transaction block already holds the write lock
+            return await asyncio.to_thread(self._execute, operation, shard_key)
+        
+        async with self._get_write_lock():
+            return await asyncio.to_thread(self._execute, operation, shard_key)
+    
+    def _get_write_lock(self) -> asyncio.Lock:
+        """Write lock for the running event loop"""
+        # asyncio locks belong to one loop; a repository is driven by one loop
+        # at a time, but tests run it on several in turn
+        loop = asyncio.get_running_loop()
+        if self._write_lock_loop is not loop:
+            self._write_lock = asyncio.Lock()
+            self._write_lock_loop = loop
+        return self._write_lock
+    
+    async def _run_read(self, operation: Callable[[sqlite3.Connection], T], shard_key: Optional[str] = None) -> T:
+        """Like _run, but for operations that only read
+        
+        Reads served by the read pool never wait for the write lock; the
+        others go through _run, so no worker thread ever blocks on a shard
+        lock held by an open transaction block.
+        """
+        if self._read_pool is None or self._current_transaction() is not None:
+            return await self._run(operation, shard_key)
+        return await asyncio.to_thread(self._execute_read, operation, shard_key)
+    
+    def _current_transaction(self) -> Optional[_Transaction]:
+        """Open transaction block the caller runs in, if any"""
+        transaction = self._transaction.get()
+        # Tasks started inside a block keep its context after the block ended
+        return transaction if transaction is not None and transaction is self._open_transaction else None
+    
+    def _enter_transaction(self, conn: sqlite3.Connection) -> contextvars.Token:
+        """Route the caller's repository calls to conn (shard lock already held)"""
+        self._open_transaction = _Transaction(conn)
+        return self._transaction.set(self._open_transaction)
+    
+    def _exit_transaction(self, token: contextvars.Token):
+        """Undo _enter_transaction"""
+        self._open_transaction = None
+        self._transaction.reset(token)
+    
+    def _commit(self, conn: sqlite3.Connection):
+        """Commit unless the statement is part of a transaction block"""
+        if self._current_transaction() is None:
+            conn.commit()
+    
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """Group the repository calls made inside the block into one transaction
+        
+        Calls issued from the current task run on a single connection and are
+        committed together on exit (one journal write instead of one per call),
+        or rolled back if the block raises. The block holds the write lock, so
+        writes from other tasks wait until it ends; reads from the read pool
+        do not wait and see the last committed state. Nested blocks become
+        savepoints of the outer transaction.
+        """
+        transaction = self._current_transaction()
+        if transaction is not None:
+            name = f"nested_{next(transaction.savepoints)}"
+            await self._run(lambda conn: conn.execute(f"SAVEPOINT {name}"))
+            try:
+                yield
+            except BaseException:
+                await self._run(lambda conn: conn.execute(f"ROLLBACK TO SAVEPOINT {name}"))
+                raise
+            finally:
+                await self._run(lambda conn: conn.execute(f"RELEASE SAVEPOINT {name}"))
+            return
+        
+        write_lock = self._get_write_lock()
+        await write_lock.acquire()
+        conn, lock = self._select_shard(None)
+        locked = False
+        try:
+            await _acquire_lock(lock)
+            locked = True
+            token = self._enter_transaction(conn)
+            try:
+                await asyncio.to_thread(conn.execute, "BEGIN IMMEDIATE")
+                try:
+                    yield
+                except BaseException:
+                    await asyncio.to_thread(conn.rollback)
+                    raise
+                await asyncio.to_thread(conn.commit)
+            finally:
+                self._exit_transaction(token)
+        finally:
+            if locked:
+                lock.release()
+            write_lock.release()
+    
+    def close(self):
+        """Close the pooled connections of a file database"""
+        for conn, lock in self._shards:
+            with lock:
+                conn.close()
+        self._shards = []
+        
+        if self._read_pool is not None:
+            # Waits for readers still in use to be returned
+            for _ in range(self._read_pool_size):
+                self._read_pool.get().close()
+            self._read_pool = None
+    
     async def save_session(
         self, 
         session_id: str, 
@@ -147,25 +691,17 @@ class SQLiteSessionRepository(SessionRepository):
         expires_at: datetime
     ) -> bool:
         """Save or update session metadata"""
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO sessions (session_id, created_at, last_accessed, expires_at)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT(session_id) DO UPDATE SET
-                    last_accessed = excluded.last_accessed,
-                    expires_at = excluded.expires_at
-            """, (
+        def save(conn: sqlite3.Connection):
+            conn.execute(_UPSERT_SESSION_SQL, (
                 session_id,
                 created_at.isoformat(),
                 last_accessed.isoformat(),
                 expires_at.isoformat()
             ))
-            
-            conn.commit()
-            self._close_connection(conn)
+            self._commit(conn)
+        
+        try:
+            await self._run(save, session_id)
             return True
             
         except Exception as e:
@@ -174,44 +710,53 @@ class SQLiteSessionRepository(SessionRepository):
     
     async def get_session(self, session_id: str) -> Optional[Dict]:
         """Get session metadata"""
+        def fetch(conn: sqlite3.Connection):
+            return conn.execute(_SELECT_SESSION_SQL, (session_id,)).fetchone()
+        
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT session_id, created_at, last_accessed, expires_at
-                FROM sessions
-                WHERE session_id = ?
-            """, (session_id,))
-            
-            row = cursor.fetchone()
-            self._close_connection(conn)
+            row = await self._run_read(fetch, session_id)
             
             if row:
-                return {
-                    "session_id": row["session_id"],
-                    "created_at": datetime.fromisoformat(row["created_at"]),
-                    "last_accessed": datetime.fromisoformat(row["last_accessed"]),
-                    "expires_at": datetime.fromisoformat(row["expires_at"])
-                }
+                return self._row_to_session(row)
             return None
             
         except Exception as e:
             logger.error(f"Error getting session {session_id}: {e}")
             return None
     
-    async def delete_session(self, session_id: str) -> bool:
-        """Delete session and all its messages"""
+    async def get_sessions(self, session_ids: List[str]) -> List[Dict]:
+        """Get metadata of several sessions; unknown ids are skipped"""
+        ids = list(dict.fromkeys(session_ids))
+        
+        def fetch(conn: sqlite3.Connection):
+            rows = []
+            for start in range(0, len(ids), MAX_IN_PARAMS):
+                chunk = ids[start:start + MAX_IN_PARAMS]
+                # Pad to a power of two with NULLs (which never match) so only
+                # a handful of distinct statements reach the statement cache
+                size = min(1 << (len(chunk) - 1).bit_length(), MAX_IN_PARAMS)
+                chunk += [None] * (size - len(chunk))
+                rows.extend(conn.execute(_select_sessions_in_sql(size), chunk).fetchall())
+            return rows
+        
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            rows = await self._run_read(fetch)
+            return [self._row_to_session(row) for row in rows]
             
+        except Exception as e:
+            logger.error(f"Error getting sessions: {e}")
+            return []
+    
+    async def delete_session(self, session_id: str) -> bool:
+        """Delete session and all its messages"""
+        def delete(conn: sqlite3.Connection):
             # Foreign key cascade will delete messages automatically
-            cursor.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-            deleted = cursor.rowcount > 0
-            
-            conn.commit()
-            self._close_connection(conn)
+            cursor = conn.execute(_DELETE_SESSION_SQL, (session_id,))
+            self._commit(conn)
+            return cursor.rowcount > 0
+        
+        try:
+            deleted = await self._run(delete, session_id)
             
             if deleted:
                 logger.info(f"Deleted session: {session_id}")
@@ -223,33 +768,45 @@ class SQLiteSessionRepository(SessionRepository):
     
     async def get_all_sessions(self) -> List[Dict]:
         """Get all sessions"""
+        def fetch(conn: sqlite3.Connection):
+            return conn.execute(_SELECT_ALL_SESSIONS_SQL).fetchall()
+        
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT session_id, created_at, last_accessed, expires_at
-                FROM sessions
-                ORDER BY last_accessed DESC
-            """)
-            
-            rows = cursor.fetchall()
-            self._close_connection(conn)
-            
-            return [
-                {
-                    "session_id": row["session_id"],
-                    "created_at": datetime.fromisoformat(row["created_at"]),
-                    "last_accessed": datetime.fromisoformat(row["last_accessed"]),
-                    "expires_at": datetime.fromisoformat(row["expires_at"])
-                }
-                for row in rows
-            ]
+            rows = await self._run_read(fetch)
+            return [self._row_to_session(row) for row in rows]
             
         except Exception as e:
             logger.error(f"Error getting all sessions: {e}")
             return []
     
+    async def iter_sessions(self, batch_size: int = 256) -> AsyncIterator[Dict]:
+        """Yield all sessions, most recently accessed first
+        
+        Sessions are read batch_size rows at a time (keyset on last_accessed,
+        session_id), so only one batch is held in memory.
+        
+        Args:
+            batch_size: Rows fetched per query
+        """
+        after: Optional[Tuple[str, str]] = None
+        try:
+            while True:
+                def fetch(conn: sqlite3.Connection, after=after):
+                    if after is None:
+                        return conn.execute(_SELECT_SESSIONS_BATCH_SQL, (batch_size,)).fetchall()
+                    return conn.execute(_SELECT_SESSIONS_BATCH_AFTER_SQL, (*after, batch_size)).fetchall()
+                
+                rows = await self._run_read(fetch)
+                for row in rows:
+                    yield self._row_to_session(row)
+                
+                if len(rows) < batch_size:
+                    return
+                after = (rows[-1]["last_accessed"], rows[-1]["session_id"])
+                
+        except Exception as e:
+            logger.error(f"Error iterating sessions: {e}")
+    
     async def save_message(
         self,
         session_id: str,
@@ -259,37 +816,62 @@ class SQLiteSessionRepository(SessionRepository):
         metadata: Optional[Dict] = None
     ) -> bool:
         """Save a message to session"""
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            metadata_json = json.dumps(metadata) if metadata else None
-            
-            cursor.execute("""
-                INSERT INTO messages (session_id, role, content, timestamp, metadata)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
+        def save(conn: sqlite3.Connection):
+            conn.execute(_INSERT_MESSAGE_SQL, (
                 session_id,
-                role,
+                _encode_role(role),
                 content,
                 timestamp.isoformat(),
-                metadata_json
+                _encode_metadata(metadata)
             ))
-            
-            conn.commit()
-            self._close_connection(conn)
+            self._commit(conn)
+        
+        try:
+            await self._run(save, session_id)
             return True
             
         except Exception as e:
             logger.error(f"Error saving message for session {session_id}: {e}")
             return False
     
+    async def add_messages(
+        self,
+        session_id: str,
+        rows: List[Tuple[str, str, datetime, Optional[Dict]]]
+    ) -> bool:
+        """Save several messages to session in a single transaction"""
+        if not rows:
+            return True
+        
+        params = [
+            (
+                session_id,
+                _encode_role(role),
+                content,
+                timestamp.isoformat(),
+                _encode_metadata(metadata)
+            )
+            for role, content, timestamp, metadata in rows
+        ]
+        
+        def save(conn: sqlite3.Connection):
+            conn.executemany(_INSERT_MESSAGE_SQL, params)
+            self._commit(conn)
+        
+        try:
+            await self._run(save, session_id)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error saving messages for session {session_id}: {e}")
+            return False
+    
     async def get_messages(
         self, 
         session_id: str, 
         page: int = 0,
         page_size: int = 10
-    ) -> List[Dict]:
+    ) -> List[Mapping[str, Any]]:
         """Get messages for a session with pagination
         
         Args:
@@ -297,75 +879,213 @@ class SQLiteSessionRepository(SessionRepository):
             page: Page number (0-based, 0 = most recent)
             page_size: Number of messages per page
         """
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            offset = page * page_size
-            
+        offset = page * page_size
+        
+        def fetch(conn: sqlite3.Connection):
             # Get messages with pagination (most recent first, then reverse)
-            query = """
-                SELECT role, content, timestamp, metadata
-                FROM (
-                    SELECT role, content, timestamp, metadata
-                    FROM messages
-                    WHERE session_id = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ? OFFSET ?
-                )
-                ORDER BY timestamp ASC
-            """
+            return conn.execute(_SELECT_MESSAGES_OFFSET_SQL, (session_id, page_size, offset)).fetchall()
+        
+        try:
+            rows = await self._run_read(fetch, session_id)
+            return self._rows_to_messages(rows)
             
-            cursor.execute(query, (session_id, page_size, offset))
+        except Exception as e:
+            logger.error(f"Error getting messages for session {session_id}: {e}")
+            return []
+    
+    async def get_messages_page(
+        self,
+        session_id: str,
+        cursor: Optional[int] = None,
+        limit: int = 10
+    ) -> Tuple[List[Mapping[str, Any]], Optional[int]]:
+        """Get messages older than cursor using keyset pagination
+        
+        Args:
+            session_id: Session ID
+            cursor: Cursor returned by the previous call (None = most recent)
+            limit: Maximum number of messages to return
+        """
+        def fetch(conn: sqlite3.Connection):
+            if cursor is None:
+                return conn.execute(_SELECT_MESSAGES_SQL, (session_id, limit)).fetchall()
             
-            rows = cursor.fetchall()
-            self._close_connection(conn)
+            return conn.execute(_SELECT_MESSAGES_BEFORE_SQL, (session_id, cursor, limit)).fetchall()
+        
+        try:
+            rows = await self._run_read(fetch, session_id)
             
-            return [
-                {
-                    "role": row["role"],
-                    "content": row["content"],
-                    "timestamp": row["timestamp"],
-                    "metadata": json.loads(row["metadata"]) if row["metadata"] else {}
-                }
-                for row in rows
-            ]
+            # A short page means there is nothing older left
+            next_cursor = rows[-1]["id"] if len(rows) == limit else None
+            return self._rows_to_messages(rows), next_cursor
             
         except Exception as e:
             logger.error(f"Error getting messages for session {session_id}: {e}")
-            return []
+            return [], None
     
-    async def delete_messages(self, session_id: str) -> bool:
-        """Delete all messages for a session"""
+    async def get_context(self, session_id: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """Get (role, content) of the most recent messages, oldest first"""
+        def fetch(conn: sqlite3.Connection):
+            # Only the projected columns are read; metadata is never decoded
+            return conn.execute(_SELECT_CONTEXT_SQL, (session_id, limit)).fetchall()
+        
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            rows = await self._run_read(fetch, session_id)
+            return [(_decode_role(row[0]), row[1]) for row in reversed(rows)]
             
-            cursor.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        except Exception as e:
+            logger.error(f"Error getting context for session {session_id}: {e}")
+            return []
+    
+    async def iter_messages(
+        self,
+        session_id: str,
+        limit: int = 10,
+        batch_size: int = 100
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (role, content) of the most recent messages, oldest first
+        
+        Rows are read batch_size at a time, so long histories are never
+        materialized as one list.
+        
+        Args:
+            session_id: Session ID
+            limit: Maximum number of messages to yield
+            batch_size: Rows fetched per query
+        """
+        def fetch_bounds(conn: sqlite3.Connection):
+            return conn.execute(_SELECT_CONTEXT_BOUNDS_SQL, (session_id, limit)).fetchone()
+        
+        try:
+            first_id, last_id = await self._run_read(fetch_bounds, session_id)
+            if first_id is None:
+                return
             
-            conn.commit()
-            self._close_connection(conn)
-            return True
+            after_id = first_id - 1
+            while True:
+                def fetch_batch(conn: sqlite3.Connection, after_id=after_id):
+                    return conn.execute(
+                        _SELECT_CONTEXT_BATCH_SQL, (session_id, after_id, last_id, batch_size)
+                    ).fetchall()
+                
+                rows = await self._run_read(fetch_batch, session_id)
+                for row in rows:
+                    yield _decode_role(row[1]), row[2]
+                
+                if len(rows) < batch_size:
+                    return
+                after_id = rows[-1][0]
+                
+        except Exception as e:
+            logger.error(f"Error iterating messages for session {session_id}: {e}")
+    
+    async def iter_all_messages(
+        self,
+        session_id: str,
+        page_size: int = 500
+    ) -> AsyncIterator[List[Mapping[str, Any]]]:
+        """Yield the whole history of a session as pages, fetched concurrently
+        
+        The session's id range is split into windows of about page_size
+        messages that are all queried at once; each page is yielded as soon
+        as its query finishes, so pages may arrive out of order (messages
+        within a page are oldest first).
+        
+        Args:
+            session_id: Session ID
+            page_size: Approximate number of messages per page (at least 1)
+        """
+        if page_size < 1:
+            raise ValueError(f"page_size must be at least 1, got {page_size}")
+        
+        def fetch_range(conn: sqlite3.Connection):
+            return conn.execute(_SELECT_ID_RANGE_SQL, (session_id,)).fetchone()
+        
+        def fetch_window(low: int, high: int):
+            def fetch(conn: sqlite3.Connection):
+                return conn.execute(_SELECT_MESSAGES_BETWEEN_SQL, (session_id, low, high)).fetchall()
+            return fetch
+        
+        try:
+            first_id, last_id, count = await self._run_read(fetch_range, session_id)
+        except Exception as e:
+            logger.error(f"Error iterating messages for session {session_id}: {e}")
+            return
+        if not count:
+            return
+        
+        windows = -(-count // page_size)
+        width = -(-(last_id - first_id + 1) // windows)
+        # Windows run on the reader pool; without one, distinct shard keys
+        # spread them over the pooled connections
+        tasks = [
+            asyncio.ensure_future(self._run_read(fetch_window(low, low + width - 1), f"{session_id}#{index}"))
+            for index, low in enumerate(range(first_id, last_id + 1, width))
+        ]
+        
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                rows = await next_page
+                if rows:
+                    yield [MessageRecord(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error iterating messages for session {session_id}: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    @staticmethod
+    def _row_to_session(row: sqlite3.Row) -> Dict:
+        """Convert a sessions row to a session dict"""
+        return {
+            "session_id": row["session_id"],
+            "created_at": datetime.fromisoformat(row["created_at"]),
+            "last_accessed": datetime.fromisoformat(row["last_accessed"]),
+            "expires_at": datetime.fromisoformat(row["expires_at"])
+        }
+    
+    @staticmethod
+    def _rows_to_messages(rows: List[sqlite3.Row]) -> List[Mapping[str, Any]]:
+        """Wrap newest-first message rows as oldest-first message mappings"""
+        return [MessageRecord(row) for row in reversed(rows)]
+    
+    async def delete_messages(self, session_id: str) -> int:
+        """Delete all messages for a session and return how many were deleted"""
+        def delete(conn: sqlite3.Connection):
+            cursor = conn.execute(_DELETE_MESSAGES_SQL, (session_id,))
+            self._commit(conn)
+            return cursor.rowcount
+        
+        try:
+            return await self._run(delete, session_id)
             
         except Exception as e:
             logger.error(f"Error deleting messages for session {session_id}: {e}")
-            return False
+            return 0
+    
+    async def get_expired_session_ids(self, expiry_time: datetime) -> List[str]:
+        """Get ids of sessions that expired before expiry_time"""
+        def fetch(conn: sqlite3.Connection):
+            # Range scan on idx_sessions_expires_at
+            return conn.execute(_SELECT_EXPIRED_SESSION_IDS_SQL, (expiry_time.isoformat(),)).fetchall()
+        
+        try:
+            rows = await self._run_read(fetch)
+            return [row[0] for row in rows]
+            
+        except Exception as e:
+            logger.error(f"Error getting expired sessions: {e}")
+            return []
     
     async def cleanup_expired_sessions(self, expiry_time: datetime) -> int:
         """Delete sessions that have expired (expires_at < now)"""
+        def delete(conn: sqlite3.Connection):
+            cursor = conn.execute(_DELETE_EXPIRED_SESSIONS_SQL, (expiry_time.isoformat(),))
+            self._commit(conn)
+            return cursor.rowcount
+        
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                DELETE FROM sessions
-                WHERE expires_at < ?
-            """, (expiry_time.isoformat(),))
-            
-            deleted_count = cursor.rowcount
-            
-            conn.commit()
-            self._close_connection(conn)
+            deleted_count = await self._run(delete)
             
             if deleted_count > 0:
                 logger.info(f"Cleaned up {deleted_count} expired sessions")
@@ -378,14 +1098,11 @@ class SQLiteSessionRepository(SessionRepository):
     
     async def get_session_count(self) -> int:
         """Get total number of active sessions"""
+        def fetch(conn: sqlite3.Connection):
+            return conn.execute(_COUNT_SESSIONS_SQL).fetchone()
+        
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) as count FROM sessions")
-            row = cursor.fetchone()
-            self._close_connection(conn)
-            
+            row = await self._run_read(fetch)
             return row["count"] if row else 0
             
         except Exception as e:
@@ -394,14 +1111,11 @@ class SQLiteSessionRepository(SessionRepository):
     
     async def get_total_message_count(self) -> int:
         """Get total number of messages across all sessions"""
+        def fetch(conn: sqlite3.Connection):
+            return conn.execute(_COUNT_MESSAGES_SQL).fetchone()
+        
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) as count FROM messages")
-            row = cursor.fetchone()
-            self._close_connection(conn)
-            
+            row = await self._run_read(fetch)
             return row["count"] if row else 0
             
         except Exception as e:
@@ -0,0 +1,77 @@
+"""
+Shared pytest configuration
+"""
+import itertools
+import pytest
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+
+@pytest.fixture(scope="session")
+def llm_api_key():
+    """OpenAI API key; skips tests that need the full LLM pipeline when unset"""
+    from config import OPENAI_API_KEY
+    if not OPENAI_API_KEY:
+        pytest.skip("OPENAI_API_KEY not configured")
+    return OPENAI_API_KEY
+
+
+@pytest.fixture
+def clock():
+    """Deterministic clock; every call returns a strictly later datetime"""
+    start = datetime(2024, 1, 1)
+    ticks = itertools.count()
+    return lambda: start + timedelta(microseconds=next(ticks))
+
+
+@pytest.fixture(scope="session")
+def shared_db(request):
+    """Shared-cache in-memory database, named per pytest-xdist worker"""
+    # workerinput only exists on xdist workers; use "master" otherwise,
+    # so the suite also runs with -p no:xdist or without xdist installed
+    worker_id = getattr(request.config, "workerinput", {}).get("workerid", "master")
+    conn = sqlite3.connect(
+        f"file:sessions_{worker_id}?mode=memory&cache=shared",
+        uri=True,
+        check_same_thread=False
+    )
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="session")
+def shared_repo(shared_db):
+    """Repository on the shared database; schema is created once per process"""
+    from session.sqlite_repository import SQLiteSessionRepository
+    return SQLiteSessionRepository(conn=shared_db)
+
+
+@contextmanager
+def _rollback_scope(repo):
+    """Run the block in one transaction on repo that is always rolled back
+
+    Repository calls made inside see each other's writes, transaction()
+    blocks become savepoints, and nothing is kept afterwards. Blocks the
+    calling thread while waiting for the connection, so it is only entered
+    from sync fixtures, outside the event loop.
+    """
+    conn, lock = repo._select_shard(None)
+    with lock:
+        token = repo._enter_transaction(conn)
+        try:
+            conn.execute("BEGIN")
+            yield
+        finally:
+            repo._exit_transaction(token)
+            conn.rollback()
+
+
+@pytest.fixture
+def memory_repo(shared_repo):
+    """Shared in-memory repository; each test's writes are rolled back
+
+    Tests must not commit on the connection themselves.
+    """
+    with _rollback_scope(shared_repo):
+        yield shared_repo
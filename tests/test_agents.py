@@ -1,10 +1,6 @@
 import pytest
-import sys
-from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
-
 from agents.base import AgentBase
 from agents.note_agent import NoteAgent
 
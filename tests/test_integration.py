@@ -2,12 +2,8 @@
 Integration tests for E2E flow
 """
 import pytest
-import sys
-from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
-
 from app import initialize_app, run_once
 
 
@@ -1,10 +1,6 @@
 import pytest
-import sys
 import json
 import tempfile
-from pathlib import Path
-
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from mcp.tools import notes
 from mcp.client import MCPClient, get_mcp_client, register_tool
@@ -2,12 +2,8 @@
 Integration tests for multi-action support with context passing
 """
 import pytest
-import sys
-from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
-
 from agents.note_agent import NoteAgent
 from agents.calendar_agent import CalendarAgent
 from agents.web_agent import WebAgent
@@ -1,10 +1,6 @@
 import pytest
-import sys
-from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
-
 
 class TestNotionCalendar:
     """Test cases for notion_calendar tool"""
@@ -4,14 +4,10 @@ Property-based tests for notion_notes MCP tool
 Feature: agent-refactoring
 """
 import pytest
-import sys
-from pathlib import Path
 from unittest.mock import MagicMock, patch
 from hypothesis import given, strategies as st, settings
 from datetime import datetime
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
-
 
 # Strategies for generating test data
 text_strategy = st.text(min_size=1, max_size=2000).filter(lambda x: x.strip())
@@ -1,345 +1,313 @@
 """
 Tests for HTTP API Server
 """
+import orjson
+import os
 import pytest
-import sys
-from pathlib import Path
+import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from server import app, initialize_app
+from session import SessionManager, SQLiteSessionRepository
 
-from server import app, initialize_app, _session_manager
+
+EXPECTED_HEALTH = {"status": "ok", "version": "0.1.0"}
+
+# /assistant may return 200, 400, or 500 depending on API key and agent availability
+OK_OR_EXPECTED_FAIL = frozenset({200, 400, 500})
+
+# Suffix for session IDs so parallel (pytest-xdist) workers never share a session
+WORKER_ID = os.environ.get("PYTEST_XDIST_WORKER", "main")
+
+# Share one event loop across the module so the client fixture can be reused.
+# The module stays on one xdist worker since its tests share that client and session.
+pytestmark = [
+    pytest.mark.asyncio(loop_scope="module"),
+    pytest.mark.xdist_group("server"),
+]
 
 
 @pytest.fixture(scope="module", autouse=True)
 def setup_server():
-    """Initialize server before tests"""
+    """Initialize server once before tests (later calls reuse the warm state)"""
     initialize_app()
     yield
 
 
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def client():
+    """Shared HTTP client for all server tests"""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def clean_sessions(monkeypatch):
+    """Swap in an empty in-memory session manager for tests that need exact counts"""
+    import server
+    manager = SessionManager(repository=SQLiteSessionRepository(":memory:"))
+    monkeypatch.setattr(server, "_session_manager", manager)
+    return manager
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def populated_session(client, llm_api_key):
+    """One session with several assistant exchanges, shared by session tests"""
+    session_id = f"test-session-shared-{WORKER_ID}"
+    await client.delete(f"/sessions/{session_id}")  # Drop leftovers from earlier runs
+    
+    responses = []
+    for i in range(5):
+        responses.append(await client.post(
+            "/assistant",
+            json={
+                "text": f"메시지 {i}",
+                "session_id": session_id
+            }
+        ))
+    
+    yield {
+        "session_id": session_id,
+        "all_ok": all(response.status_code == 200 for response in responses)
+    }
+
+
 class TestServerAPI:
     """Test cases for API server endpoints"""
     
-    @pytest.mark.asyncio
-    async def test_root_endpoint(self):
+    async def test_root_endpoint(self, client):
         """Test root endpoint returns health status"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.get("/")
-            
-            assert response.status_code == 200
-            data = response.json()
-            assert data["status"] == "ok"
-            assert "version" in data
+        response = await client.get("/")
+        
+        assert response.status_code == 200
+        assert orjson.loads(response.content) == EXPECTED_HEALTH
     
-    @pytest.mark.asyncio
-    async def test_health_endpoint(self):
+    async def test_health_endpoint(self, client):
         """Test health check endpoint"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.get("/health")
-            
-            assert response.status_code == 200
-            data = response.json()
-            assert data["status"] == "ok"
-            assert data["version"] == "0.1.0"
+        response = await client.get("/health")
+        
+        assert response.status_code == 200
+        assert orjson.loads(response.content) == EXPECTED_HEALTH
     
-    @pytest.mark.asyncio
-    async def test_assistant_endpoint_success(self):
+    @pytest.mark.usefixtures("llm_api_key")
+    async def test_assistant_endpoint_success(self, client):
         """Test assistant endpoint with valid request"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/assistant",
-                json={"text": "안녕하세요"}
-            )
-            
-            # May return 200, 400, or 500 depending on API key and agent availability
-            assert response.status_code in [200, 400, 500]
-            if response.status_code == 200:
-                data = response.json()
-                assert "response" in data
-                assert "intent" in data
-                assert "agent" in data
-                assert "status" in data
+        response = await client.post(
+            "/assistant",
+            json={"text": "안녕하세요"}
+        )
+        
+        # May return 200, 400, or 500 depending on API key and agent availability
+        assert response.status_code in OK_OR_EXPECTED_FAIL
+        if response.status_code == 200:
+            data = response.json()
+            assert "response" in data
+            assert "intent" in data
+            assert "agent" in data
+            assert "status" in data
     
-    @pytest.mark.asyncio
-    async def test_assistant_endpoint_empty_text(self):
+    @pytest.mark.usefixtures("llm_api_key")
+    async def test_assistant_endpoint_empty_text(self, client):
         """Test assistant endpoint with empty text"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/assistant",
-                json={"text": ""}
-            )
-            
-            # Should still process but might return unknown intent
-            assert response.status_code in [200, 400, 500]
+        response = await client.post(
+            "/assistant",
+            json={"text": ""}
+        )
+        
+        # Should still process but might return unknown intent
+        assert response.status_code in OK_OR_EXPECTED_FAIL
     
-    @pytest.mark.asyncio
-    async def test_assistant_endpoint_note_request(self):
+    @pytest.mark.usefixtures("llm_api_key")
+    async def test_assistant_endpoint_note_request(self, client):
         """Test assistant endpoint with note creation request"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/assistant",
-                json={"text": "메모 작성해줘: 테스트 메모"}
-            )
-            
-            # May return 200, 400, or 500 depending on API key and agent availability
-            assert response.status_code in [200, 400, 500]
-            if response.status_code == 200:
-                data = response.json()
-                assert data["intent"] in ["write_note", "unknown"]
-                assert data["agent"] in ["NoteAgent", "FallbackAgent"]
+        response = await client.post(
+            "/assistant",
+            json={"text": "메모 작성해줘: 테스트 메모"}
+        )
+        
+        # May return 200, 400, or 500 depending on API key and agent availability
+        assert response.status_code in OK_OR_EXPECTED_FAIL
+        if response.status_code == 200:
+            data = response.json()
+            assert data["intent"] in ["write_note", "unknown"]
+            assert data["agent"] in ["NoteAgent", "FallbackAgent"]
     
-    @pytest.mark.asyncio
-    async def test_assistant_endpoint_web_search(self):
+    @pytest.mark.usefixtures("llm_api_key")
+    async def test_assistant_endpoint_web_search(self, client):
         """Test assistant endpoint with web search request"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/assistant",
-                json={"text": "파이썬 검색해줘"}
-            )
-            
-            # May return 200, 400, or 500 depending on API key and agent availability
-            assert response.status_code in [200, 400, 500]
-            if response.status_code == 200:
-                data = response.json()
-                assert data["intent"] in ["web_search", "unknown"]
+        response = await client.post(
+            "/assistant",
+            json={"text": "파이썬 검색해줘"}
+        )
+        
+        # May return 200, 400, or 500 depending on API key and agent availability
+        assert response.status_code in OK_OR_EXPECTED_FAIL
+        if response.status_code == 200:
+            data = response.json()
+            assert data["intent"] in ["web_search", "unknown"]
     
-    @pytest.mark.asyncio
-    async def test_assistant_endpoint_invalid_json(self):
+    async def test_assistant_endpoint_invalid_json(self, client):
         """Test assistant endpoint with invalid JSON"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/assistant",
-                content="invalid json",
-                headers={"Content-Type": "application/json"}
-            )
-            
-            assert response.status_code == 422  # Unprocessable Entity
+        response = await client.post(
+            "/assistant",
+            content="invalid json",
+            headers={"Content-Type": "application/json"}
+        )
+        
+        assert response.status_code == 422  # Unprocessable Entity
     
-    @pytest.mark.asyncio
-    async def test_assistant_endpoint_missing_text_field(self):
+    async def test_assistant_endpoint_missing_text_field(self, client):
         """Test assistant endpoint with missing text field"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/assistant",
-                json={"message": "wrong field"}
-            )
-            
-            assert response.status_code == 422  # Unprocessable Entity
+        response = await client.post(
+            "/assistant",
+            json={"message": "wrong field"}
+        )
+        
+        assert response.status_code == 422  # Unprocessable Entity
 
 
 class TestServerSession:
     """Test session management endpoints"""
     
-    @pytest.mark.asyncio
-    async def test_assistant_with_session_id(self):
+    @pytest.mark.usefixtures("llm_api_key")
+    async def test_assistant_with_session_id(self, client):
         """Test assistant endpoint with session ID"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/assistant",
-                json={
-                    "text": "안녕하세요",
-                    "session_id": "test-session-123"
-                }
-            )
-            
-            assert response.status_code in [200, 400, 500]
-            if response.status_code == 200:
-                data = response.json()
-                assert data["session_id"] == "test-session-123"
+        session_id = f"test-session-123-{WORKER_ID}"
+        response = await client.post(
+            "/assistant",
+            json={
+                "text": "안녕하세요",
+                "session_id": session_id
+            }
+        )
+        
+        assert response.status_code in OK_OR_EXPECTED_FAIL
+        if response.status_code == 200:
+            data = response.json()
+            assert data["session_id"] == session_id
     
-    @pytest.mark.asyncio
-    async def test_assistant_without_session_id(self):
+    @pytest.mark.usefixtures("llm_api_key")
+    async def test_assistant_without_session_id(self, client):
         """Test assistant endpoint without session ID"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/assistant",
-                json={"text": "안녕하세요"}
-            )
-            
-            assert response.status_code in [200, 400, 500]
-            if response.status_code == 200:
-                data = response.json()
-                assert data["session_id"] is None
+        response = await client.post(
+            "/assistant",
+            json={"text": "안녕하세요"}
+        )
+        
+        assert response.status_code in OK_OR_EXPECTED_FAIL
+        if response.status_code == 200:
+            data = response.json()
+            assert data["session_id"] is None
     
-    @pytest.mark.asyncio
-    async def test_session_persistence(self):
+    async def test_session_persistence(self, client, populated_session):
         """Test that session persists across multiple requests"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            session_id = "test-session-persistence"
-            
-            # First request
-            response1 = await client.post(
-                "/assistant",
-                json={
-                    "text": "첫 번째 메시지",
-                    "session_id": session_id
-                }
-            )
-            
-            # Second request with same session
-            response2 = await client.post(
-                "/assistant",
-                json={
-                    "text": "두 번째 메시지",
-                    "session_id": session_id
-                }
-            )
+        session_id = populated_session["session_id"]
+        
+        if populated_session["all_ok"]:
+            # Check session info
+            info_response = await client.get(f"/sessions/{session_id}")
+            assert info_response.status_code == 200
             
-            if response1.status_code == 200 and response2.status_code == 200:
-                # Check session info
-                info_response = await client.get(f"/sessions/{session_id}")
-                assert info_response.status_code == 200
-                
-                info_data = info_response.json()
-                assert info_data["session_id"] == session_id
-                assert info_data["message_count"] >= 2  # At least 2 messages
+            info_data = info_response.json()
+            assert info_data["session_id"] == session_id
+            assert info_data["message_count"] >= 2  # At least 2 messages
     
-    @pytest.mark.asyncio
-    async def test_get_session_info(self):
+    async def test_get_session_info(self, client, populated_session):
         """Test getting session info with messages"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            session_id = "test-session-info"
-            
-            # Create session by making request
-            await client.post(
-                "/assistant",
-                json={
-                    "text": "테스트 메시지",
-                    "session_id": session_id
-                }
-            )
-            
-            # Get session info
-            response = await client.get(f"/sessions/{session_id}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                assert data["session_id"] == session_id
-                assert "message_count" in data
-                assert "created_at" in data
-                assert "last_accessed" in data
-                assert "messages" in data
-                assert isinstance(data["messages"], list)
-                # Should have at least user message and assistant response
-                assert data["message_count"] >= 2
+        session_id = populated_session["session_id"]
+        
+        # Get session info
+        response = await client.get(f"/sessions/{session_id}")
+        
+        if response.status_code == 200:
+            data = response.json()
+            assert data["session_id"] == session_id
+            assert "message_count" in data
+            assert "created_at" in data
+            assert "last_accessed" in data
+            assert "messages" in data
+            assert isinstance(data["messages"], list)
+            # Should have at least user message and assistant response
+            assert data["message_count"] >= 2
     
-    @pytest.mark.asyncio
-    async def test_get_nonexistent_session(self):
+    async def test_get_nonexistent_session(self, client):
         """Test getting info for non-existent session"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.get("/sessions/nonexistent-session")
-            assert response.status_code == 404
-    
-    @pytest.mark.asyncio
-    async def test_delete_session(self):
-        """Test deleting a session"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            session_id = "test-session-delete"
-            
-            # Create session
-            await client.post(
-                "/assistant",
-                json={
-                    "text": "테스트 메시지",
-                    "session_id": session_id
-                }
-            )
-            
-            # Delete session
-            delete_response = await client.delete(f"/sessions/{session_id}")
-            
-            if delete_response.status_code == 200:
-                # Verify session is deleted
-                info_response = await client.get(f"/sessions/{session_id}")
-                assert info_response.status_code == 404
+        response = await client.get("/sessions/nonexistent-session")
+        assert response.status_code == 404
     
-    @pytest.mark.asyncio
-    async def test_delete_nonexistent_session(self):
+    async def test_delete_nonexistent_session(self, client):
         """Test deleting non-existent session"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.delete("/sessions/nonexistent-session")
-            assert response.status_code == 404
+        response = await client.delete("/sessions/nonexistent-session")
+        assert response.status_code == 404
     
-    @pytest.mark.asyncio
-    async def test_get_session_info_with_pagination(self):
+    async def test_get_session_info_with_pagination(self, client, populated_session):
         """Test getting session info with pagination"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            session_id = "test-session-pagination"
-            
-            # Create session with multiple messages
-            for i in range(5):
-                await client.post(
-                    "/assistant",
-                    json={
-                        "text": f"메시지 {i}",
-                        "session_id": session_id
-                    }
-                )
-            
-            # Get session info with page 0 (most recent)
-            response = await client.get(f"/sessions/{session_id}?page=0&page_size=3")
-            
-            if response.status_code == 200:
-                data = response.json()
-                assert data["session_id"] == session_id
-                # Should return only 3 messages
-                assert len(data["messages"]) <= 3
-            
-            # Get session info with page 1 (next page)
-            response = await client.get(f"/sessions/{session_id}?page=1&page_size=3")
-            
-            if response.status_code == 200:
-                data = response.json()
-                assert data["session_id"] == session_id
+        session_id = populated_session["session_id"]
+        
+        # Get session info with page 0 (most recent)
+        response = await client.get(f"/sessions/{session_id}?page=0&page_size=3")
+        
+        if response.status_code == 200:
+            data = response.json()
+            assert data["session_id"] == session_id
+            # Should return only 3 messages
+            assert len(data["messages"]) <= 3
+        
+        # Get session info with page 1 (next page)
+        response = await client.get(f"/sessions/{session_id}?page=1&page_size=3")
+        
+        if response.status_code == 200:
+            data = response.json()
+            assert data["session_id"] == session_id
     
-    @pytest.mark.asyncio
-    async def test_session_stats(self):
+    async def test_session_stats(self, client, clean_sessions):
         """Test getting session statistics"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.get("/sessions-stats")
-            
-            assert response.status_code == 200
-            data = response.json()
-            assert "active_sessions" in data
-            assert "total_messages" in data
-            assert isinstance(data["active_sessions"], int)
-            assert isinstance(data["total_messages"], int)
+        session = await clean_sessions.get_or_create_session("test-session-stats")
+        await session.add_message("user", "안녕하세요")
+        await session.add_message("assistant", "안녕하세요!")
+        
+        response = await client.get("/sessions-stats")
+        
+        assert response.status_code == 200
+        assert orjson.loads(response.content) == {"active_sessions": 1, "total_messages": 2}
+    
+    async def test_delete_session(self, client, populated_session):
+        """Test deleting a session (runs last; consumes the shared session)"""
+        session_id = populated_session["session_id"]
+        
+        # Delete session
+        delete_response = await client.delete(f"/sessions/{session_id}")
+        
+        if delete_response.status_code == 200:
+            # Verify session is deleted
+            info_response = await client.get(f"/sessions/{session_id}")
+            assert info_response.status_code == 404
 
 
-class TestServerCORS:
-    """Test CORS configuration"""
+class TestServerInitialization:
+    """Test server initialization"""
     
-    @pytest.mark.asyncio
-    async def test_cors_headers(self):
-        """Test CORS headers are present"""
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.options(
-                "/assistant",
-                headers={
-                    "Origin": "http://localhost:3000",
-                    "Access-Control-Request-Method": "POST"
-                }
-            )
-            
-            # CORS should allow the request
-            assert response.status_code == 200
-            assert "access-control-allow-origin" in response.headers
+    async def test_initialize_app_is_idempotent(self):
+        """Test repeated initialization reuses the existing agent instances"""
+        import server
+        agents_before = server._agent_instances
+        
+        initialize_app()
+        
+        assert server._agent_instances is agents_before
+
+
+async def test_cors_headers(client):
+    """Test CORS headers are present"""
+    response = await client.options(
+        "/assistant",
+        headers={
+            "Origin": "http://localhost:3000",
+            "Access-Control-Request-Method": "POST"
+        }
+    )
+    
+    # CORS should allow the request
+    assert response.status_code == 200
+    assert "access-control-allow-origin" in response.headers
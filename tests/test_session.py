@@ -1,12 +1,10 @@
 """
 Tests for Session Management
 """
+import asyncio
 import pytest
-import sys
-from pathlib import Path
 from datetime import datetime, timedelta
-
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from unittest.mock import patch
 
 from session import SessionManager, ConversationHistory
 
@@ -15,20 +13,16 @@ class TestConversationHistory:
     """Test ConversationHistory class"""
     
     @pytest.mark.asyncio
-    async def test_create_history(self):
+    async def test_create_history(self, memory_repo):
         """Test creating conversation history"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        history = ConversationHistory("test-session", repo)
+        history = ConversationHistory("test-session", memory_repo)
         assert history.session_id == "test-session"
         assert isinstance(history.created_at, datetime)
     
     @pytest.mark.asyncio
-    async def test_add_message(self):
+    async def test_add_message(self, memory_repo):
         """Test adding messages to history"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        history = ConversationHistory("test-session", repo)
+        history = ConversationHistory("test-session", memory_repo)
         
         await history.add_message("user", "안녕하세요")
         messages = await history.get_messages()
@@ -41,11 +35,9 @@ class TestConversationHistory:
         assert len(messages) == 2
     
     @pytest.mark.asyncio
-    async def test_add_message_with_metadata(self):
+    async def test_add_message_with_metadata(self, memory_repo):
         """Test adding message with metadata"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        history = ConversationHistory("test-session", repo)
+        history = ConversationHistory("test-session", memory_repo)
         
         metadata = {"intent": "greeting", "agent": "FallbackAgent"}
         await history.add_message("assistant", "안녕하세요", metadata=metadata)
@@ -54,11 +46,82 @@ class TestConversationHistory:
         assert messages[0]["metadata"] == metadata
     
     @pytest.mark.asyncio
-    async def test_get_messages(self):
+    async def test_add_message_batches_writes(self, memory_repo):
+        """Test that consecutive adds are written in one repository call"""
+        history = ConversationHistory("test-session", memory_repo)
+        
+        with patch.object(memory_repo, "add_messages", wraps=memory_repo.add_messages) as add_messages:
+            for i in range(5):
+                await history.add_message("user", f"메시지 {i}")
+            messages = await history.get_messages()
+        
+        add_messages.assert_awaited_once()
+        assert [m["content"] for m in messages] == [f"메시지 {i}" for i in range(5)]
+    
+    @pytest.mark.asyncio
+    async def test_read_waits_for_in_flight_flush(self, memory_repo):
+        """Test that a read does not overtake a flush that is still writing"""
+        history = ConversationHistory("test-session", memory_repo)
+        add_messages = memory_repo.add_messages
+        write_started, finish_write = asyncio.Event(), asyncio.Event()
+        
+        async def slow_add_messages(session_id, rows):
+            write_started.set()
+            await finish_write.wait()
+            return await add_messages(session_id, rows)
+        
+        with patch.object(memory_repo, "add_messages", side_effect=slow_add_messages):
+            await history.add_message("user", "메시지")
+            await write_started.wait()
+            reader = asyncio.create_task(history.get_messages())
+            await asyncio.sleep(0.01)
+            assert not reader.done()
+            
+            finish_write.set()
+            messages = await reader
+        
+        assert [m["content"] for m in messages] == ["메시지"]
+    
+    @pytest.mark.asyncio
+    async def test_clear_waits_for_in_flight_flush(self, memory_repo):
+        """Test that messages being written when clear() starts do not come back"""
+        history = ConversationHistory("test-session", memory_repo)
+        add_messages = memory_repo.add_messages
+        write_started, finish_write = asyncio.Event(), asyncio.Event()
+        
+        async def slow_add_messages(session_id, rows):
+            write_started.set()
+            await finish_write.wait()
+            return await add_messages(session_id, rows)
+        
+        with patch.object(memory_repo, "add_messages", side_effect=slow_add_messages):
+            writer = asyncio.create_task(history.add_messages([("user", "메시지", None)]))
+            await write_started.wait()
+            clearing = asyncio.create_task(history.clear())
+            await asyncio.sleep(0.01)
+            
+            finish_write.set()
+            await asyncio.gather(writer, clearing)
+        
+        assert await history.get_messages() == []
+    
+    @pytest.mark.asyncio
+    async def test_failed_flush_keeps_messages_pending(self, memory_repo):
+        """Test that messages survive a failed write and are retried"""
+        history = ConversationHistory("test-session", memory_repo)
+        
+        with patch.object(memory_repo, "add_messages", return_value=False):
+            await history.add_message("user", "메시지")
+            assert await history.flush() is False
+        
+        assert await history.flush() is True
+        messages = await history.get_messages()
+        assert [m["content"] for m in messages] == ["메시지"]
+    
+    @pytest.mark.asyncio
+    async def test_get_messages(self, memory_repo):
         """Test getting all messages"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        history = ConversationHistory("test-session", repo)
+        history = ConversationHistory("test-session", memory_repo)
         
         await history.add_message("user", "메시지 1")
         await history.add_message("assistant", "응답 1")
@@ -68,11 +131,9 @@ class TestConversationHistory:
         assert len(messages) == 3
     
     @pytest.mark.asyncio
-    async def test_get_messages_with_pagination(self):
+    async def test_get_messages_with_pagination(self, memory_repo):
         """Test getting messages with pagination"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        history = ConversationHistory("test-session", repo)
+        history = ConversationHistory("test-session", memory_repo)
         
         for i in range(10):
             await history.add_message("user", f"메시지 {i}")
@@ -90,11 +151,9 @@ class TestConversationHistory:
         assert next_page[-1]["content"] == "메시지 6"
     
     @pytest.mark.asyncio
-    async def test_get_context_for_llm(self):
+    async def test_get_context_for_llm(self, memory_repo):
         """Test getting LLM context format"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        history = ConversationHistory("test-session", repo)
+        history = ConversationHistory("test-session", memory_repo)
         
         await history.add_message("user", "안녕하세요")
         await history.add_message("assistant", "안녕하세요!")
@@ -107,11 +166,9 @@ class TestConversationHistory:
         assert "metadata" not in context[0]
     
     @pytest.mark.asyncio
-    async def test_get_context_for_llm_with_limit(self):
+    async def test_get_context_for_llm_with_limit(self, memory_repo):
         """Test getting limited LLM context"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        history = ConversationHistory("test-session", repo)
+        history = ConversationHistory("test-session", memory_repo)
         
         for i in range(20):
             await history.add_message("user", f"메시지 {i}")
@@ -123,11 +180,54 @@ class TestConversationHistory:
         assert context[-1]["content"] == "메시지 19"
     
     @pytest.mark.asyncio
-    async def test_clear_history(self):
+    async def test_iter_context_for_llm(self, memory_repo):
+        """Test streaming LLM context matches the list variant"""
+        history = ConversationHistory("test-session", memory_repo)
+        
+        for i in range(5):
+            await history.add_message("user", f"메시지 {i}")
+        
+        streamed = [msg async for msg in history.iter_context_for_llm(limit=3)]
+        assert streamed == await history.get_context_for_llm(limit=3)
+    
+    @pytest.mark.asyncio
+    async def test_get_context_for_llm_cached(self, memory_repo):
+        """Test that cached LLM context follows new messages without repository reads"""
+        history = ConversationHistory("test-session", memory_repo, context_cache_ttl_seconds=60)
+        
+        for i in range(3):
+            await history.add_message("user", f"메시지 {i}")
+        await history.get_context_for_llm(limit=3)
+        
+        with patch.object(memory_repo, "get_context", wraps=memory_repo.get_context) as get_context:
+            await history.add_message("assistant", "응답")
+            context = await history.get_context_for_llm(limit=3)
+            assert [m["content"] for m in context] == ["메시지 1", "메시지 2", "응답"]
+            
+            await history.clear()
+            assert await history.get_context_for_llm(limit=3) == []
+        
+        get_context.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_context_cache_skips_unwritten_messages(self, memory_repo):
+        """Test that cached LLM context only follows messages that were stored"""
+        history = ConversationHistory("test-session", memory_repo, context_cache_ttl_seconds=60)
+        await history.add_message("user", "메시지")
+        await history.get_context_for_llm(limit=3)
+        
+        with patch.object(memory_repo, "add_messages", return_value=False):
+            await history.add_message("assistant", "응답")
+            context = await history.get_context_for_llm(limit=3)
+            assert [m["content"] for m in context] == ["메시지"]
+        
+        context = await history.get_context_for_llm(limit=3)
+        assert [m["content"] for m in context] == ["메시지", "응답"]
+    
+    @pytest.mark.asyncio
+    async def test_clear_history(self, memory_repo):
         """Test clearing conversation history"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        history = ConversationHistory("test-session", repo)
+        history = ConversationHistory("test-session", memory_repo)
         
         await history.add_message("user", "메시지 1")
         await history.add_message("assistant", "응답 1")
@@ -139,16 +239,12 @@ class TestConversationHistory:
         assert len(messages) == 0
     
     @pytest.mark.asyncio
-    async def test_last_accessed_updates(self):
+    async def test_last_accessed_updates(self, memory_repo):
         """Test that last_accessed updates on message add"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        history = ConversationHistory("test-session", repo)
+        # Start from a fixed past time instead of sleeping
+        history = ConversationHistory("test-session", memory_repo, created_at=datetime(2024, 1, 1))
         initial_time = history.last_accessed
         
-        import time
-        time.sleep(0.01)
-        
         await history.add_message("user", "메시지")
         assert history.last_accessed > initial_time
 
@@ -157,20 +253,16 @@ class TestSessionManager:
     """Test SessionManager class"""
     
     @pytest.mark.asyncio
-    async def test_create_manager(self):
+    async def test_create_manager(self, memory_repo):
         """Test creating session manager"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo)
+        manager = SessionManager(repository=memory_repo)
         count = await manager.get_active_session_count()
         assert count == 0
     
     @pytest.mark.asyncio
-    async def test_get_or_create_session(self):
+    async def test_get_or_create_session(self, memory_repo):
         """Test getting or creating session"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo)
+        manager = SessionManager(repository=memory_repo)
         
         session1 = await manager.get_or_create_session("session-1")
         assert session1.session_id == "session-1"
@@ -184,11 +276,57 @@ class TestSessionManager:
         assert count == 1
     
     @pytest.mark.asyncio
-    async def test_get_session(self):
+    async def test_get_or_create_session_coalesces_access_writes(self, memory_repo):
+        """Test that rapid re-access does not rewrite the session row each time"""
+        manager = SessionManager(repository=memory_repo)
+        
+        session = await manager.get_or_create_session("session-1")
+        first_access = session.last_accessed
+        
+        with patch.object(memory_repo, "save_session", wraps=memory_repo.save_session) as save_session:
+            for _ in range(3):
+                await manager.get_or_create_session("session-1")
+        
+        save_session.assert_not_called()
+        assert session.last_accessed > first_access
+    
+    @pytest.mark.asyncio
+    async def test_session_cache_is_lru_bounded(self, memory_repo):
+        """Test that the least recently used session is evicted from memory only"""
+        manager = SessionManager(repository=memory_repo, max_sessions=2)
+        
+        await manager.get_or_create_session("session-1")
+        await manager.get_or_create_session("session-2")
+        await manager.get_or_create_session("session-1")  # session-2 is now LRU
+        await manager.get_or_create_session("session-3")
+        
+        assert list(manager.sessions) == ["session-1", "session-3"]
+        assert await manager.get_active_session_count() == 3
+        assert await manager.get_session("session-2") is not None
+    
+    @pytest.mark.asyncio
+    async def test_session_cache_keeps_sessions_with_pending_writes(self, memory_repo):
+        """Test that a session is not evicted while it has unwritten messages"""
+        manager = SessionManager(repository=memory_repo, max_sessions=2)
+        
+        pending = await manager.get_or_create_session("session-1")
+        await pending.add_message("user", "메시지")
+        await manager.get_or_create_session("session-2")
+        await manager.get_or_create_session("session-3")
+        
+        assert list(manager.sessions) == ["session-1", "session-3"]
+        
+        await manager.flush_all()
+        await manager.get_or_create_session("session-4")
+        assert list(manager.sessions) == ["session-3", "session-4"]
+        
+        messages = await (await manager.get_session("session-1")).get_messages()
+        assert [m["content"] for m in messages] == ["메시지"]
+    
+    @pytest.mark.asyncio
+    async def test_get_session(self, memory_repo):
         """Test getting existing session"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo)
+        manager = SessionManager(repository=memory_repo)
         
         await manager.get_or_create_session("session-1")
         
@@ -201,11 +339,23 @@ class TestSessionManager:
         assert session is None
     
     @pytest.mark.asyncio
-    async def test_delete_session(self):
+    async def test_prewarm(self, memory_repo, clock):
+        """Test loading stored sessions into the cache in one batch"""
+        now = clock()
+        for sid in ("session-1", "session-2"):
+            await memory_repo.save_session(sid, now, now, now + timedelta(days=7))
+        
+        manager = SessionManager(repository=memory_repo)
+        loaded = await manager.prewarm(["session-1", "session-2", "non-existent"])
+        
+        assert loaded == 2
+        assert set(manager.sessions) == {"session-1", "session-2"}
+        assert await manager.prewarm(["session-1"]) == 0
+    
+    @pytest.mark.asyncio
+    async def test_delete_session(self, memory_repo):
         """Test deleting session"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo)
+        manager = SessionManager(repository=memory_repo)
         
         await manager.get_or_create_session("session-1")
         count = await manager.get_active_session_count()
@@ -221,36 +371,38 @@ class TestSessionManager:
         assert deleted is False
     
     @pytest.mark.asyncio
-    async def test_multiple_sessions(self):
+    async def test_multiple_sessions(self, memory_repo):
         """Test managing multiple sessions"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo)
+        manager = SessionManager(repository=memory_repo)
         
-        session1 = await manager.get_or_create_session("user-1")
-        session2 = await manager.get_or_create_session("user-2")
-        session3 = await manager.get_or_create_session("user-3")
+        session1, session2, session3 = await asyncio.gather(
+            manager.get_or_create_session("user-1"),
+            manager.get_or_create_session("user-2"),
+            manager.get_or_create_session("user-3")
+        )
         
         count = await manager.get_active_session_count()
         assert count == 3
         
-        await session1.add_message("user", "메시지 1")
-        await session2.add_message("user", "메시지 2")
+        await asyncio.gather(
+            session1.add_message("user", "메시지 1"),
+            session2.add_message("user", "메시지 2")
+        )
         
-        messages1 = await session1.get_messages()
-        messages2 = await session2.get_messages()
-        messages3 = await session3.get_messages()
+        messages1, messages2, messages3 = await asyncio.gather(
+            session1.get_messages(),
+            session2.get_messages(),
+            session3.get_messages()
+        )
         
         assert len(messages1) == 1
         assert len(messages2) == 1
         assert len(messages3) == 0
     
     @pytest.mark.asyncio
-    async def test_cleanup_expired_sessions(self):
+    async def test_cleanup_expired_sessions(self, memory_repo):
         """Test cleaning up expired sessions based on expires_at"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo, session_expiry_days=7)
+        manager = SessionManager(repository=memory_repo, session_expiry_days=7)
         
         # Create sessions
         session1 = await manager.get_or_create_session("session-1")
@@ -259,7 +411,7 @@ class TestSessionManager:
         # Manually set session1 as expired in repository
         now = datetime.now()
         expired_time = now - timedelta(days=1)  # Expired yesterday
-        await repo.save_session("session-1", session1.created_at, now, expired_time)
+        await memory_repo.save_session("session-1", session1.created_at, now, expired_time)
         
         count = await manager.get_active_session_count()
         assert count == 2
@@ -274,23 +426,18 @@ class TestSessionManager:
         assert "session-2" in manager.sessions
     
     @pytest.mark.asyncio
-    async def test_session_expiry_configuration(self):
+    async def test_session_expiry_configuration(self, memory_repo):
         """Test session expiry configuration"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo, session_expiry_days=7)
+        manager = SessionManager(repository=memory_repo, session_expiry_days=7)
         assert manager.session_expiry_days == 7
         
-        repo2 = SQLiteSessionRepository(db_path=":memory:")
-        manager2 = SessionManager(repository=repo2, session_expiry_days=30)
+        manager2 = SessionManager(repository=memory_repo, session_expiry_days=30)
         assert manager2.session_expiry_days == 30
     
     @pytest.mark.asyncio
-    async def test_get_active_session_count(self):
+    async def test_get_active_session_count(self, memory_repo):
         """Test getting active session count"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo)
+        manager = SessionManager(repository=memory_repo)
         
         count = await manager.get_active_session_count()
         assert count == 0
@@ -313,31 +460,23 @@ class TestSessionIntegration:
     """Integration tests for session management"""
     
     @pytest.mark.asyncio
-    async def test_conversation_flow(self):
+    async def test_conversation_flow(self, memory_repo):
         """Test complete conversation flow"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo)
+        manager = SessionManager(repository=memory_repo)
         session = await manager.get_or_create_session("user-123")
         
-        # User asks to create note
-        await session.add_message("user", "오늘 한 일 메모해줘: 프로젝트 완료")
-        await session.add_message(
-            "assistant", 
-            "메모를 작성했습니다.",
-            metadata={"intent": "write_note", "agent": "NoteAgent"}
-        )
-        
-        # User asks to list notes
-        await session.add_message("user", "내 메모 목록 보여줘")
-        await session.add_message(
-            "assistant",
-            "메모 목록입니다: ...",
-            metadata={"intent": "list_notes", "agent": "NoteAgent"}
-        )
+        await session.add_messages([
+            # User asks to create note
+            ("user", "오늘 한 일 메모해줘: 프로젝트 완료", None),
+            ("assistant", "메모를 작성했습니다.", {"intent": "write_note", "agent": "NoteAgent"}),
+            # User asks to list notes
+            ("user", "내 메모 목록 보여줘", None),
+            ("assistant", "메모 목록입니다: ...", {"intent": "list_notes", "agent": "NoteAgent"}),
+        ])
         
         messages = await session.get_messages()
         assert len(messages) == 4
+        assert messages[1]["metadata"] == {"intent": "write_note", "agent": "NoteAgent"}
         
         # Get context for LLM
         context = await session.get_context_for_llm()
@@ -346,11 +485,9 @@ class TestSessionIntegration:
         assert context[1]["role"] == "assistant"
     
     @pytest.mark.asyncio
-    async def test_session_persistence_across_requests(self):
+    async def test_session_persistence_across_requests(self, memory_repo):
         """Test session persists across multiple requests"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo)
+        manager = SessionManager(repository=memory_repo)
         
         # First request
         session1 = await manager.get_or_create_session("user-456")
@@ -368,20 +505,24 @@ class TestSessionIntegration:
         assert len(messages) == 3
     
     @pytest.mark.asyncio
-    async def test_isolated_sessions(self):
+    async def test_isolated_sessions(self, memory_repo):
         """Test that sessions are isolated from each other"""
-        from session.sqlite_repository import SQLiteSessionRepository
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        manager = SessionManager(repository=repo)
+        manager = SessionManager(repository=memory_repo)
         
-        session_a = await manager.get_or_create_session("user-a")
-        session_b = await manager.get_or_create_session("user-b")
+        session_a, session_b = await asyncio.gather(
+            manager.get_or_create_session("user-a"),
+            manager.get_or_create_session("user-b")
+        )
         
-        await session_a.add_message("user", "User A 메시지")
-        await session_b.add_message("user", "User B 메시지")
+        await asyncio.gather(
+            session_a.add_message("user", "User A 메시지"),
+            session_b.add_message("user", "User B 메시지")
+        )
         
-        messages_a = await session_a.get_messages()
-        messages_b = await session_b.get_messages()
+        messages_a, messages_b = await asyncio.gather(
+            session_a.get_messages(),
+            session_b.get_messages()
+        )
         
         assert len(messages_a) == 1
         assert len(messages_b) == 1
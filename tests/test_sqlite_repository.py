@@ -1,28 +1,66 @@
 """
 Tests for SQLite Session Repository
 """
+import asyncio
+import os
+import sqlite3
 import pytest
-import sys
-from pathlib import Path
+import pytest_asyncio
 from datetime import datetime, timedelta
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
-
+from session.repository import SessionRepository
 from session.sqlite_repository import SQLiteSessionRepository
 
+# The repository stores the datetimes it is given, so tests use a fixed clock
+BASE_TIME = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def repo(memory_repo):
+    """Repository shared by the in-memory tests, emptied between them"""
+    return memory_repo
+
+
+@pytest.fixture
+def file_repo(tmp_path):
+    """Factory for repositories on tmp_path/sessions.db, all closed at teardown"""
+    repos = []
+    
+    def open_repo(db_path=None, **kwargs):
+        repo = SQLiteSessionRepository(db_path=db_path or str(tmp_path / "sessions.db"), **kwargs)
+        repos.append(repo)
+        return repo
+    
+    yield open_repo
+    for repo in reversed(repos):
+        repo.close()
+
+
+@pytest_asyncio.fixture(loop_scope="module")
+async def seeded_session(request, repo, clock):
+    """Session "test-session" holding "Message 0".."Message N-1" (N = param, default 10)"""
+    session_id = "test-session"
+    now = clock()
+    await repo.save_session(session_id, now, now, now + timedelta(days=7))
+    # One executemany for all rows
+    await repo.add_messages(session_id, [
+        ("user", f"Message {i}", clock(), None) for i in range(getattr(request, "param", 10))
+    ])
+    return session_id
+
 
 class TestSQLiteRepository:
-    """Test SQLite repository implementation"""
+    """Test SQLite repository implementation
+    
+    Async tests share one module-scoped event loop instead of one per test.
+    """
     
-    @pytest.mark.asyncio
-    async def test_save_and_get_session(self):
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_save_and_get_session(self, repo):
         """Test saving and retrieving session"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
         session_id = "test-session"
-        created_at = datetime.now()
-        last_accessed = datetime.now()
-        expires_at = datetime.now() + timedelta(days=7)
+        created_at = last_accessed = BASE_TIME
+        expires_at = BASE_TIME + timedelta(days=7)
         
         # Save session
         result = await repo.save_session(session_id, created_at, last_accessed, expires_at)
@@ -36,21 +74,43 @@ class TestSQLiteRepository:
         assert isinstance(session["last_accessed"], datetime)
         assert isinstance(session["expires_at"], datetime)
     
-    @pytest.mark.asyncio
-    async def test_get_nonexistent_session(self):
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_get_nonexistent_session(self, repo):
         """Test getting non-existent session"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
         session = await repo.get_session("nonexistent")
         assert session is None
     
-    @pytest.mark.asyncio
-    async def test_delete_session(self):
-        """Test deleting session"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_get_sessions(self, repo):
+        """Test fetching several sessions at once"""
+        now = BASE_TIME
+        expires_at = now + timedelta(days=7)
+        for i in range(3):
+            await repo.save_session(f"session-{i}", now, now, expires_at)
+        
+        # More ids than fit in one IN (...) list, most of them unknown
+        ids = ["session-0", "session-2"] + [f"missing-{i}" for i in range(1000)]
+        sessions = await repo.get_sessions(ids)
+        assert sorted(s["session_id"] for s in sessions) == ["session-0", "session-2"]
+        assert isinstance(sessions[0]["expires_at"], datetime)
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_get_sessions_reuses_statement_text(self, repo):
+        """Test that IN lists of similar length share one cached SQL text"""
+        from session.sqlite_repository import _select_sessions_in_sql
+        _select_sessions_in_sql.cache_clear()
+        
+        await repo.get_sessions(["a", "b", "c"])
+        await repo.get_sessions(["a", "b", "c", "d"])
         
+        info = _select_sessions_in_sql.cache_info()
+        assert (info.misses, info.hits, info.currsize) == (1, 1, 1)
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_delete_session(self, repo):
+        """Test deleting session"""
         session_id = "test-session"
-        now = datetime.now()
+        now = BASE_TIME
         expires_at = now + timedelta(days=7)
         await repo.save_session(session_id, now, now, expires_at)
         
@@ -66,31 +126,29 @@ class TestSQLiteRepository:
         deleted = await repo.delete_session("nonexistent")
         assert deleted is False
     
-    @pytest.mark.asyncio
-    async def test_save_and_get_messages(self):
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_save_and_get_messages(self, repo, clock):
         """Test saving and retrieving messages"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
         session_id = "test-session"
-        now = datetime.now()
+        now = clock()
         expires_at = now + timedelta(days=7)
-        await repo.save_session(session_id, now, now, expires_at)
         
-        # Save messages
-        await repo.save_message(
-            session_id=session_id,
-            role="user",
-            content="Hello",
-            timestamp=datetime.now()
-        )
-        
-        await repo.save_message(
-            session_id=session_id,
-            role="assistant",
-            content="Hi there!",
-            timestamp=datetime.now(),
-            metadata={"intent": "greeting"}
-        )
+        # Save session and messages in one transaction
+        async with repo.transaction():
+            await repo.save_session(session_id, now, now, expires_at)
+            await repo.save_message(
+                session_id=session_id,
+                role="user",
+                content="Hello",
+                timestamp=clock()
+            )
+            await repo.save_message(
+                session_id=session_id,
+                role="assistant",
+                content="Hi there!",
+                timestamp=clock(),
+                metadata={"intent": "greeting"}
+            )
         
         # Get messages
         messages = await repo.get_messages(session_id)
@@ -99,92 +157,186 @@ class TestSQLiteRepository:
         assert messages[0]["content"] == "Hello"
         assert messages[1]["role"] == "assistant"
         assert messages[1]["metadata"] == {"intent": "greeting"}
+        # Decoded once, then served from the record
+        assert messages[1].metadata is messages[1]["metadata"]
     
-    @pytest.mark.asyncio
-    async def test_get_messages_with_pagination(self):
-        """Test getting messages with pagination"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_add_messages(self, repo, clock):
+        """Test saving several messages in one batch"""
         session_id = "test-session"
-        now = datetime.now()
-        expires_at = now + timedelta(days=7)
-        await repo.save_session(session_id, now, now, expires_at)
+        now = clock()
+        await repo.save_session(session_id, now, now, now + timedelta(days=7))
         
-        # Save 10 messages
-        for i in range(10):
-            await repo.save_message(
-                session_id=session_id,
-                role="user",
-                content=f"Message {i}",
-                timestamp=datetime.now()
-            )
+        result = await repo.add_messages(session_id, [
+            ("user", "Hello", now, None),
+            ("assistant", "Hi there!", clock(), {"intent": "greeting"}),
+        ])
+        assert result is True
         
-        # Get page 0 (most recent 3 messages)
-        messages = await repo.get_messages(session_id, page=0, page_size=3)
-        assert len(messages) == 3
-        assert messages[0]["content"] == "Message 7"
-        assert messages[-1]["content"] == "Message 9"
-        
-        # Get page 1 (next 3 messages)
-        messages = await repo.get_messages(session_id, page=1, page_size=3)
-        assert len(messages) == 3
-        assert messages[0]["content"] == "Message 4"
-        assert messages[-1]["content"] == "Message 6"
-        
-        # Get page 2 (next 3 messages)
-        messages = await repo.get_messages(session_id, page=2, page_size=3)
-        assert len(messages) == 3
-        assert messages[0]["content"] == "Message 1"
-        assert messages[-1]["content"] == "Message 3"
-    
-    @pytest.mark.asyncio
-    async def test_delete_messages(self):
-        """Test deleting messages"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
+        messages = await repo.get_messages(session_id)
+        assert [m["content"] for m in messages] == ["Hello", "Hi there!"]
+        assert messages[0]["metadata"] == {}
+        assert messages[1]["metadata"] == {"intent": "greeting"}
+        assert dict(messages[0]) == {
+            "role": "user",
+            "content": "Hello",
+            "timestamp": now.isoformat(),
+            "metadata": {}
+        }
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_get_messages_with_pagination(self, repo, seeded_session):
+        """Test getting messages with pagination"""
+        session_id = seeded_session
         
-        session_id = "test-session"
-        now = datetime.now()
-        expires_at = now + timedelta(days=7)
-        await repo.save_session(session_id, now, now, expires_at)
+        # Pages are independent reads; fetch pages 0-2 (most recent first) together
+        pages = await asyncio.gather(*(
+            repo.get_messages(session_id, page=page, page_size=3) for page in range(3)
+        ))
         
-        await repo.save_message(session_id, "user", "Hello", datetime.now())
-        await repo.save_message(session_id, "assistant", "Hi", datetime.now())
+        for messages, (first, last) in zip(pages, [(7, 9), (4, 6), (1, 3)]):
+            assert len(messages) == 3
+            assert messages[0]["content"] == f"Message {first}"
+            assert messages[-1]["content"] == f"Message {last}"
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    @pytest.mark.parametrize("seeded_session", [7], indirect=True)
+    @pytest.mark.parametrize("get_page", [
+        SQLiteSessionRepository.get_messages_page,
+        SessionRepository.get_messages_page,
+    ], ids=["sqlite", "default"])
+    async def test_get_messages_page_with_cursor(self, repo, seeded_session, get_page):
+        """Test walking message history with cursors"""
+        session_id = seeded_session
+        
+        messages, cursor = await get_page(repo, session_id, limit=3)
+        assert [m["content"] for m in messages] == ["Message 4", "Message 5", "Message 6"]
+        assert cursor is not None
+        
+        messages, cursor = await get_page(repo, session_id, cursor=cursor, limit=3)
+        assert [m["content"] for m in messages] == ["Message 1", "Message 2", "Message 3"]
+        
+        # Last page is short and has no further cursor
+        messages, cursor = await get_page(repo, session_id, cursor=cursor, limit=3)
+        assert [m["content"] for m in messages] == ["Message 0"]
+        assert cursor is None
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_custom_roles_round_trip(self, repo):
+        """Test that roles outside ROLE_NAMES, including numeric ones, come back unchanged"""
+        session_id = "test-session"
+        now = BASE_TIME
+        roles = ["0", "7", "1.5", "critic", ":tagged"]
+        await repo.save_session(session_id, now, now, now + timedelta(days=7))
+        await repo.add_messages(session_id, [(role, f"from {role}", now, None) for role in roles])
+        
+        messages = await repo.get_messages(session_id, page_size=len(roles))
+        assert [m["role"] for m in messages] == roles
+        context = await repo.get_context(session_id, limit=len(roles))
+        assert [role for role, _ in context] == roles
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_get_context(self, repo):
+        """Test getting recent (role, content) pairs oldest first"""
+        session_id = "test-session"
+        now = BASE_TIME
+        await repo.save_session(session_id, now, now, now + timedelta(days=7))
+        await repo.add_messages(session_id, [
+            ("user", "Hello", now, None),
+            ("assistant", "Hi", now, {"intent": "greeting"}),
+            ("user", "Bye", now, None),
+        ])
+        
+        context = await repo.get_context(session_id, limit=2)
+        assert context == [("assistant", "Hi"), ("user", "Bye")]
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    @pytest.mark.parametrize("seeded_session", [7], indirect=True)
+    async def test_iter_messages(self, repo, seeded_session):
+        """Test streaming recent messages in batches, oldest first"""
+        session_id = seeded_session
         
-        # Delete messages
-        result = await repo.delete_messages(session_id)
-        assert result is True
+        rows = [row async for row in repo.iter_messages(session_id, limit=5, batch_size=2)]
+        assert rows == [("user", f"Message {i}") for i in range(2, 7)]
         
-        # Verify deleted
-        messages = await repo.get_messages(session_id)
-        assert len(messages) == 0
+        assert [row async for row in repo.iter_messages("nonexistent")] == []
     
-    @pytest.mark.asyncio
-    async def test_cascade_delete(self):
-        """Test that deleting session deletes messages"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
+    def test_context_query_uses_covering_index(self, repo):
+        """Test that the LLM context query is answered from the index alone"""
+        from session.sqlite_repository import _SELECT_CONTEXT_SQL
+        conn = repo._get_connection()
+        plan = " ".join(
+            row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {_SELECT_CONTEXT_SQL}", ("s", 10))
+        )
+        assert "COVERING INDEX idx_messages_context" in plan
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_iter_all_messages(self, repo):
+        """Test exporting a whole history as concurrently fetched pages"""
+        now = BASE_TIME
+        for session_id in ("session-a", "session-b"):
+            await repo.save_session(session_id, now, now, now + timedelta(days=7))
+        for i in range(7):
+            await repo.add_messages("session-a", [("user", f"A {i}", now, None)])
+            await repo.add_messages("session-b", [("user", f"B {i}", now, None)])
+        
+        pages = [page async for page in repo.iter_all_messages("session-a", page_size=3)]
+        
+        assert len(pages) == 3
+        contents = sorted(m["content"] for page in pages for m in page)
+        assert contents == [f"A {i}" for i in range(7)]
+        assert [page async for page in repo.iter_all_messages("nonexistent")] == []
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    @pytest.mark.parametrize("page_size", [0, -1])
+    async def test_iter_all_messages_rejects_invalid_page_size(self, repo, seeded_session, page_size):
+        """Test that a page_size below 1 raises instead of failing mid-iteration"""
+        with pytest.raises(ValueError):
+            async for _ in repo.iter_all_messages(seeded_session, page_size=page_size):
+                pass
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    @pytest.mark.parametrize("delete_method,expected", [
+        ("delete_messages", 2),
+        ("delete_session", True),
+    ])
+    async def test_delete_removes_messages(self, repo, delete_method, expected):
+        """Test that deleting messages, or the session (cascade), removes its messages"""
         session_id = "test-session"
-        now = datetime.now()
+        now = BASE_TIME
         expires_at = now + timedelta(days=7)
-        await repo.save_session(session_id, now, now, expires_at)
+        async with repo.transaction():
+            await repo.save_session(session_id, now, now, expires_at)
+            await repo.save_message(session_id, "user", "Hello", now)
+            await repo.save_message(session_id, "assistant", "Hi", now)
         
-        await repo.save_message(session_id, "user", "Hello", datetime.now())
-        await repo.save_message(session_id, "assistant", "Hi", datetime.now())
+        result = await getattr(repo, delete_method)(session_id)
+        assert result == expected
         
-        # Delete session
-        await repo.delete_session(session_id)
-        
-        # Messages should be deleted too
-        messages = await repo.get_messages(session_id)
-        assert len(messages) == 0
+        # Verify nothing is left to delete
+        assert await repo.delete_messages(session_id) == 0
     
-    @pytest.mark.asyncio
-    async def test_cleanup_expired_sessions(self):
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_transaction_rolls_back_on_error(self, repo):
+        """Test that a failing transaction block discards its writes"""
+        now = BASE_TIME
+        with pytest.raises(RuntimeError):
+            async with repo.transaction():
+                await repo.save_session("session-1", now, now, now + timedelta(days=7))
+                await repo.save_message("session-1", "user", "Hello", now)
+                raise RuntimeError("abort")
+        
+        assert await repo.get_session("session-1") is None
+        assert await repo.get_total_message_count() == 0
+        
+        # The repository is usable again afterwards
+        assert await repo.save_session("session-1", now, now, now + timedelta(days=7)) is True
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_cleanup_expired_sessions(self, repo):
         """Test cleaning up expired sessions based on expires_at"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
         # Create sessions with different expiry times
-        now = datetime.now()
+        now = BASE_TIME
         
         # session-1: expired 2 hours ago
         await repo.save_session("session-1", now, now, now - timedelta(hours=2))
@@ -193,29 +345,35 @@ class TestSQLiteRepository:
         # session-3: expires in 7 days
         await repo.save_session("session-3", now, now, now + timedelta(days=7))
         
+        expired_ids = await repo.get_expired_session_ids(now)
+        assert expired_ids == ["session-1"]
+        
         # Cleanup sessions that have expired (expires_at < now)
         deleted_count = await repo.cleanup_expired_sessions(now)
         
         assert deleted_count == 1
         
-        # Verify
-        session1 = await repo.get_session("session-1")
-        session2 = await repo.get_session("session-2")
-        session3 = await repo.get_session("session-3")
+        # Verify with one batched lookup; only the still valid sessions remain
+        remaining = await repo.get_sessions(["session-1", "session-2", "session-3"])
+        assert sorted(s["session_id"] for s in remaining) == ["session-2", "session-3"]
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_default_get_expired_session_ids(self, repo):
+        """Test that the base class fallback matches the indexed query"""
+        now = BASE_TIME
+        await repo.save_session("session-1", now, now, now - timedelta(hours=2))
+        await repo.save_session("session-2", now, now, now + timedelta(days=6))
         
-        assert session1 is None  # Expired
-        assert session2 is not None  # Still valid
-        assert session3 is not None  # Still valid
+        expired_ids = await SessionRepository.get_expired_session_ids(repo, now)
+        assert expired_ids == await repo.get_expired_session_ids(now) == ["session-1"]
     
-    @pytest.mark.asyncio
-    async def test_get_session_count(self):
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_get_session_count(self, repo):
         """Test getting session count"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
         count = await repo.get_session_count()
         assert count == 0
         
-        now = datetime.now()
+        now = BASE_TIME
         expires_at = now + timedelta(days=7)
         await repo.save_session("session-1", now, now, expires_at)
         await repo.save_session("session-2", now, now, expires_at)
@@ -228,37 +386,58 @@ class TestSQLiteRepository:
         count = await repo.get_session_count()
         assert count == 1
     
-    @pytest.mark.asyncio
-    async def test_get_total_message_count(self):
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_get_total_message_count(self, repo):
         """Test getting total message count"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
         count = await repo.get_total_message_count()
         assert count == 0
         
         # Create sessions with messages
-        now = datetime.now()
+        now = BASE_TIME
         expires_at = now + timedelta(days=7)
-        await repo.save_session("session-1", now, now, expires_at)
-        await repo.save_message("session-1", "user", "Hello", now)
-        await repo.save_message("session-1", "assistant", "Hi", now)
-        
-        await repo.save_session("session-2", now, now, expires_at)
-        await repo.save_message("session-2", "user", "Test", now)
+        async with repo.transaction():
+            await repo.save_session("session-1", now, now, expires_at)
+            await repo.save_message("session-1", "user", "Hello", now)
+            await repo.save_message("session-1", "assistant", "Hi", now)
+            
+            await repo.save_session("session-2", now, now, expires_at)
+            await repo.save_message("session-2", "user", "Test", now)
         
         count = await repo.get_total_message_count()
         assert count == 3
     
-    @pytest.mark.asyncio
-    async def test_get_all_sessions(self):
+    @pytest.mark.parametrize("sql_name,params", [
+        ("_SELECT_MESSAGES_OFFSET_SQL", ("s", 3, 6)),
+        ("_SELECT_MESSAGES_SQL", ("s", 3)),
+        ("_SELECT_MESSAGES_BEFORE_SQL", ("s", 100, 3)),
+    ])
+    def test_pagination_uses_index(self, repo, sql_name, params):
+        """Test that message pages are read in index order without a sort"""
+        import session.sqlite_repository as sqlite_repository
+        conn = repo._get_connection()
+        plan = " ".join(
+            row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {getattr(sqlite_repository, sql_name)}", params)
+        )
+        assert "USING INDEX idx_messages_" in plan
+        assert "TEMP B-TREE" not in plan
+    
+    @pytest.mark.parametrize("sql_name", ["_COUNT_SESSIONS_SQL", "_COUNT_MESSAGES_SQL"])
+    def test_count_uses_count_opcode(self, repo, sql_name):
+        """Test that count queries use SQLite's Count opcode and read no rows"""
+        import session.sqlite_repository as sqlite_repository
+        conn = repo._get_connection()
+        opcodes = {row[1] for row in conn.execute(f"EXPLAIN {getattr(sqlite_repository, sql_name)}")}
+        assert "Count" in opcodes
+        assert "Column" not in opcodes
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_get_all_sessions(self, repo):
         """Test getting all sessions"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
         sessions = await repo.get_all_sessions()
         assert len(sessions) == 0
         
         # Create sessions
-        now = datetime.now()
+        now = BASE_TIME
         expires_at = now + timedelta(days=7)
         await repo.save_session("session-1", now, now, expires_at)
         await repo.save_session("session-2", now, now, expires_at)
@@ -266,27 +445,32 @@ class TestSQLiteRepository:
         
         sessions = await repo.get_all_sessions()
         assert len(sessions) == 3
-        assert all("session_id" in s for s in sessions)
-        assert all("created_at" in s for s in sessions)
-        assert all("last_accessed" in s for s in sessions)
-        assert all("expires_at" in s for s in sessions)
+        required = {"session_id", "created_at", "last_accessed", "expires_at"}
+        assert all(required <= s.keys() for s in sessions)
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_iter_sessions(self, repo, clock):
+        """Test streaming all sessions in batches, most recently accessed first"""
+        for i in range(5):
+            now = clock()
+            await repo.save_session(f"session-{i}", now, now, now + timedelta(days=7))
+        
+        sessions = [s async for s in repo.iter_sessions(batch_size=2)]
+        assert [s["session_id"] for s in sessions] == [f"session-{i}" for i in reversed(range(5))]
+        assert sessions == await repo.get_all_sessions()
     
-    @pytest.mark.asyncio
-    async def test_update_session_access_time(self):
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_update_session_access_time(self, repo):
         """Test updating session access time and expiry"""
-        repo = SQLiteSessionRepository(db_path=":memory:")
-        
         session_id = "test-session"
-        created_at = datetime.now()
-        first_access = datetime.now()
+        created_at = BASE_TIME
+        first_access = created_at
         first_expires = first_access + timedelta(days=7)
         
         await repo.save_session(session_id, created_at, first_access, first_expires)
         
         # Update access time and expiry
-        import time
-        time.sleep(0.01)
-        second_access = datetime.now()
+        second_access = first_access + timedelta(seconds=1)
         second_expires = second_access + timedelta(days=7)
         await repo.save_session(session_id, created_at, second_access, second_expires)
         
@@ -294,3 +478,196 @@ class TestSQLiteRepository:
         session = await repo.get_session(session_id)
         assert session["last_accessed"] > first_access
         assert session["expires_at"] > first_expires
+    
+    def test_file_database_pragmas(self, file_repo):
+        """Test that file database connections run in WAL mode with tuned PRAGMAs"""
+        repo = file_repo(shards=1)
+        
+        conn = repo._get_connection()
+        pragmas = {
+            name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+            for name in ("journal_mode", "synchronous", "temp_store", "cache_size", "foreign_keys")
+        }
+        repo._close_connection(conn)
+        
+        assert pragmas == {
+            "journal_mode": "wal",
+            "synchronous": 1,  # NORMAL
+            "temp_store": 2,  # MEMORY
+            "cache_size": -64000,
+            "foreign_keys": 1
+        }
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_file_database_concurrent_access(self, file_repo):
+        """Test that a file-backed repository serves concurrent calls"""
+        repo = file_repo(shards=2)
+        
+        now = BASE_TIME
+        expires_at = now + timedelta(days=7)
+        results = await asyncio.gather(*(
+            repo.save_session(f"session-{i}", now, now, expires_at)
+            for i in range(5)
+        ))
+        assert all(results)
+        assert await repo.get_session_count() == 5
+        
+        # Writes through one pooled connection are visible through the others
+        sessions = await asyncio.gather(*(repo.get_session(f"session-{i}") for i in range(5)))
+        assert all(sessions)
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_file_database_read_pool(self, file_repo):
+        """Test that reads are served by read-only connections"""
+        repo = file_repo(shards=1, read_pool_size=2)
+        
+        now = BASE_TIME
+        await repo.save_session("session-1", now, now, now + timedelta(days=7))
+        sessions = await asyncio.gather(*(repo.get_session("session-1") for _ in range(32)))
+        assert all(s["session_id"] == "session-1" for s in sessions)
+        
+        def write(conn):
+            conn.execute("DELETE FROM sessions")
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            await repo._run_read(write)
+        
+        # Reads inside a transaction see its uncommitted writes
+        async with repo.transaction():
+            await repo.save_session("session-2", now, now, now + timedelta(days=7))
+            assert await repo.get_session("session-2") is not None
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_cancelled_transaction_releases_lock(self, file_repo):
+        """Test that cancelling a transaction() waiting for the lock does not leak it"""
+        repo = file_repo(shards=1)
+        now = BASE_TIME
+        entered, release = asyncio.Event(), asyncio.Event()
+        
+        async def hold():
+            async with repo.transaction():
+                entered.set()
+                await release.wait()
+        
+        async def wait_for_lock():
+            async with repo.transaction():
+                pass
+        
+        holder = asyncio.create_task(hold())
+        await entered.wait()
+        waiter = asyncio.create_task(wait_for_lock())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        
+        release.set()
+        await holder
+        saved = await asyncio.wait_for(repo.save_session("session-1", now, now, now), timeout=5)
+        assert saved is True
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_writes_wait_for_open_transaction(self, file_repo):
+        """Test that writes on other shards queue behind a transaction instead of failing"""
+        repo = file_repo(shards=4)
+        now = BASE_TIME
+        entered, release = asyncio.Event(), asyncio.Event()
+        
+        async def hold():
+            async with repo.transaction():
+                await repo.save_session("session-0", now, now, now)
+                entered.set()
+                await release.wait()
+        
+        holder = asyncio.create_task(hold())
+        await entered.wait()
+        writers = asyncio.gather(*(
+            repo.save_session(f"session-{i}", now, now, now) for i in range(1, 9)
+        ))
+        await asyncio.sleep(0.05)
+        assert not writers.done()
+        
+        release.set()
+        await holder
+        assert all(await writers)
+        assert await repo.get_session_count() == 9
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    @pytest.mark.parametrize("in_memory", [True, False], ids=["memory", "file_without_read_pool"])
+    async def test_reads_wait_for_open_transaction(self, file_repo, in_memory):
+        """Test that reads sharing the transaction's connection do not tie up worker threads"""
+        repo = file_repo(":memory:" if in_memory else None, shards=1, read_pool_size=0)
+        now = BASE_TIME
+        # More readers than the default executor has threads
+        readers_count = min(32, (os.cpu_count() or 1) + 4) + 2
+        entered, release = asyncio.Event(), asyncio.Event()
+        
+        async def hold():
+            async with repo.transaction():
+                entered.set()
+                await release.wait()
+                # Needs a worker thread while the readers are waiting
+                await repo.save_session("session-1", now, now, now)
+        
+        holder = asyncio.create_task(hold())
+        await entered.wait()
+        readers = asyncio.gather(*(repo.get_session("session-1") for _ in range(readers_count)))
+        await asyncio.sleep(0.05)
+        assert not readers.done()
+        
+        release.set()
+        await asyncio.wait_for(holder, timeout=5)
+        sessions = await asyncio.wait_for(readers, timeout=5)
+        assert all(session is not None for session in sessions)
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_migrates_legacy_message_columns(self, file_repo):
+        """Test that TEXT metadata and role written by older versions are converted"""
+        repo = file_repo()
+        now = BASE_TIME
+        await repo.save_session("session-1", now, now, now + timedelta(days=7))
+        
+        conn = repo._get_connection()
+        conn.execute("""
+            INSERT INTO messages (session_id, role, content, timestamp, metadata)
+            VALUES ('session-1', 'assistant', 'Hi', ?, '{"intent": "greeting"}')
+        """, (now.isoformat(),))
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+        repo._close_connection(conn)
+        repo.close()
+        
+        repo = file_repo()
+        conn = repo._get_connection()
+        stored_types = conn.execute("SELECT typeof(role), typeof(metadata) FROM messages").fetchone()
+        repo._close_connection(conn)
+        
+        assert tuple(stored_types) == ("integer", "blob")
+        messages = await repo.get_messages("session-1")
+        assert messages[0]["role"] == "assistant"
+        assert messages[0]["metadata"] == {"intent": "greeting"}
+    
+    def test_migration_drops_redundant_message_indexes(self, file_repo):
+        """Test that indexes covered by idx_messages_context are dropped from older databases"""
+        repo = file_repo()
+        conn = repo._get_connection()
+        conn.execute("CREATE INDEX idx_messages_session_id ON messages(session_id)")
+        conn.execute("CREATE INDEX idx_messages_session_id_id ON messages(session_id, id)")
+        conn.execute("PRAGMA user_version = 2")
+        conn.commit()
+        repo._close_connection(conn)
+        repo.close()
+        
+        repo = file_repo()
+        conn = repo._get_connection()
+        indexes = {
+            row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages'"
+            )
+        }
+        user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        repo._close_connection(conn)
+        
+        assert "idx_messages_session_id" not in indexes
+        assert "idx_messages_session_id_id" not in indexes
+        assert "idx_messages_context" in indexes
+        assert user_version == 3